@@ -0,0 +1,431 @@
+"""HTTP API over the classification pipeline, for clients without a browser (mobile app, kiosks).
+
+    python api.py --port 8080
+    curl -F images=@bottle.jpg -F state=Karnataka http://localhost:8080/v1/classify
+    curl -N -H "Accept: text/event-stream" -F images=@bottle.jpg http://localhost:8080/v1/classify
+    curl "http://localhost:8080/v1/rules?state=Karnataka&city=Bangalore"
+
+Classification requests go on a bounded asyncio queue (API_QUEUE_SIZE) served by
+API_WORKERS workers. When the queue is full the API answers 503 with Retry-After
+instead of piling up work. Every request has a deadline (API_DEADLINE_SECONDS, or
+less via the X-Deadline-Seconds header): a request still queued at its deadline is
+dropped, and a running one stops waiting and answers 504 with what has finished.
+
+Engines, caches, the result store and the model rate limit are the process-wide
+ones from scrap_core. With API_PORT set, the Streamlit process serves the API as
+well, so one deployment answers both and they share every cache.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from memory_budget import memory_budget
+from preprocess import preprocess_cached
+from prompts import PROMPTS, VARIANTS, token_ledger
+from report import BatchSummary
+from rules_store import rules_store
+from scrap_core import DEFAULT_LOCATION, ClassificationEngine, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Also serve the API from the Streamlit process on this port (0: only via "python api.py")
+API_PORT = int(os.getenv("API_PORT", "0"))
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+API_QUEUE_SIZE = int(os.getenv("API_QUEUE_SIZE", "32"))
+API_DEADLINE_SECONDS = float(os.getenv("API_DEADLINE_SECONDS", "60"))
+API_MAX_IMAGES = int(os.getenv("API_MAX_IMAGES", "20"))
+API_MAX_IMAGE_MB = float(os.getenv("API_MAX_IMAGE_MB", "15"))
+
+_READ_CHUNK = 256 * 1024
+
+
+class Overloaded(Exception):
+    """The work queue is full"""
+
+
+@dataclass
+class Job:
+    engine: ClassificationEngine
+    uploads: List[Tuple[str, bytes]]  # (file name, content)
+    location: Dict[str, str]
+    deadline: float  # in loop.time()
+    events: "asyncio.Queue[Tuple[str, Optional[int], Any]]" = field(default_factory=asyncio.Queue)
+    # Set when the client gives up (deadline, disconnect); the worker then stops early
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    queued_at: float = field(default_factory=time.perf_counter)
+    # Bytes of uploads charged to memory_budget while they wait; returned once the worker has prepared them
+    charged: int = 0
+
+
+def _release_uploads(job: Job) -> None:
+    """Drop the job's raw upload bytes and return their charge to the memory budget"""
+    job.uploads.clear()
+    memory_budget.credit(job.charged)
+    job.charged = 0
+
+
+def _failed(error: str) -> Dict[str, Any]:
+    return {"record": None, "error": error, "duplicate_of": None, "matched_locally": False}
+
+
+class ClassificationService:
+    """Bounded queue of classification jobs and the workers that run them"""
+
+    def __init__(self, workers: int = API_WORKERS, queue_size: int = API_QUEUE_SIZE):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.running = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(self.queue_size)
+        # The pipeline blocks (decoding, model calls), so each worker drives it from its own thread
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="api-worker")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job: Job) -> None:
+        # A full queue can hold API_QUEUE_SIZE requests of raw photos, so they count against the budget until prepared
+        size = sum(len(data) for _, data in job.uploads)
+        if not memory_budget.charge(size):
+            raise Overloaded()
+        job.charged = size
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            _release_uploads(job)
+            raise Overloaded() from None
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                metrics.observe(metrics.SPAN_METRIC, time.perf_counter() - job.queued_at, span="api_queue_wait")
+                if job.cancelled.is_set() or loop.time() >= job.deadline:
+                    job.events.put_nowait(("expired", None, None))
+                    continue
+                self.running += 1
+                try:
+                    await loop.run_in_executor(self._executor, self._run, job, loop)
+                except Exception as e:
+                    logger.exception("Classification job failed")
+                    job.events.put_nowait(("failed", None, str(e) or e.__class__.__name__))
+                finally:
+                    self.running -= 1
+            finally:
+                _release_uploads(job)
+                self._queue.task_done()
+
+    @staticmethod
+    def _run(job: Job, loop: asyncio.AbstractEventLoop) -> None:
+        """Worker thread: prepare the uploads and stream the engine's events back to the loop"""
+        def emit(kind: str, index: Optional[int], payload: Any):
+            loop.call_soon_threadsafe(job.events.put_nowait, (kind, index, payload))
+
+        with memory_budget.session() as allowance:
+            images, positions = [], []
+            for position, (name, data) in enumerate(job.uploads):
+                if job.cancelled.is_set():
+                    return
+                try:
+                    prepared = preprocess_cached(data)
+                except Exception:
+                    # Headers were checked on upload; this is a truncated or corrupt body
+                    logger.warning("Could not decode upload %r", name, exc_info=True)
+                    emit("done", position, _failed("could not read image"))
+                    continue
+                kept = allowance.admit(prepared)
+                if kept is None:
+                    emit("done", position, _failed("skipped to stay within the memory budget; send fewer images"))
+                    continue
+                images.append(kept)
+                positions.append(position)
+            # The session allowance now holds what is kept of each photo; the raw bytes are no longer needed
+            _release_uploads(job)
+
+            stream = job.engine.classify_stream(images, job.location)
+            try:
+                for kind, index, payload in stream:
+                    if job.cancelled.is_set():
+                        return
+                    if kind == "done" and payload["duplicate_of"] is not None:
+                        # The engine numbers the admitted images; clients know the uploads
+                        payload = dict(payload, duplicate_of=positions[payload["duplicate_of"]])
+                    emit(kind, positions[index], payload)
+            finally:
+                # Runs the engine's cleanup (finished answers are still stored)
+                stream.close()
+        emit("end", None, None)
+
+
+service = ClassificationService()
+
+
+def _result_json(index: int, name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    record = result["record"]
+    return {
+        "index": index,
+        "filename": name,
+        "record": record.to_dict() if record is not None else None,
+        "error": result["error"],
+        "duplicate_of": result["duplicate_of"],
+        "matched_locally": result["matched_locally"],
+    }
+
+
+def _error(status: int, message: str, **headers) -> JSONResponse:
+    metrics.inc("ecogenie_api_requests_total", endpoint="classify", status=str(status))
+    return JSONResponse({"error": message}, status_code=status, headers=headers or None)
+
+
+async def _events(job: Job):
+    """The job's events until it ends; ("timeout", None, None) once the deadline passes"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(job.events.get(), max(0.0, job.deadline - loop.time()))
+            except asyncio.TimeoutError:
+                yield ("timeout", None, None)
+                return
+            yield event
+            if event[0] in ("end", "expired", "failed"):
+                return
+    finally:
+        # Deadline, client disconnect or normal end: the worker has nothing left to do for us
+        job.cancelled.set()
+
+
+class UploadRejected(Exception):
+    """An uploaded file the API will not process"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def _read_upload(upload, name: str, max_bytes: int) -> bytes:
+    """The upload's content, read in chunks so an oversized file is rejected before it is all in memory"""
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"{name} is larger than {API_MAX_IMAGE_MB:g} MB")
+    chunks, total = [], 0
+    while True:
+        chunk = await upload.read(_READ_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadRejected(413, f"{name} is larger than {API_MAX_IMAGE_MB:g} MB")
+        chunks.append(chunk)
+    data = b"".join(chunks)
+    try:
+        # Only parses the header; decoding happens on a worker
+        Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError):
+        raise UploadRejected(400, f"{name} is not a readable image") from None
+    return data
+
+
+async def classify(request: Request):
+    try:
+        form = await request.form(max_files=API_MAX_IMAGES, max_fields=10)
+    except MultiPartException as e:
+        return _error(400, e.message)
+    except HTTPException as e:  # Starlette's wrapping of MultiPartException inside an app
+        return _error(e.status_code, e.detail)
+    files = [f for f in form.getlist("images") if hasattr(f, "read")]
+    if not files:
+        return _error(400, "Send one or more photos as multipart form fields named 'images'")
+    app = form.get("app") or "app"
+    if app not in PROMPTS:
+        return _error(400, f"Unknown app {app!r}; expected one of {sorted(PROMPTS)}")
+    variant = form.get("variant") or None
+    if variant is not None and variant not in VARIANTS:
+        return _error(400, f"Unknown variant {variant!r}; expected one of {sorted(VARIANTS)}")
+    state = rules_store.canonical_state(form.get("state") or DEFAULT_LOCATION["state"])
+    if state is None:
+        return _error(400, "Unknown state; GET /v1/states lists the accepted names")
+
+    max_bytes = int(API_MAX_IMAGE_MB * 1024 * 1024)
+    uploads = []
+    for i, f in enumerate(files):
+        name = f.filename or f"image-{i}"
+        try:
+            uploads.append((name, await _read_upload(f, name, max_bytes)))
+        except UploadRejected as e:
+            return _error(e.status, e.message)
+
+    location = {"city": form.get("city") or "", "state": state, "country": DEFAULT_LOCATION["country"]}
+    try:
+        timeout = min(API_DEADLINE_SECONDS, float(request.headers.get("x-deadline-seconds", API_DEADLINE_SECONDS)))
+    except ValueError:
+        return _error(400, "X-Deadline-Seconds must be a number")
+    names = [name for name, _ in uploads]
+    loop = asyncio.get_running_loop()
+    job = Job(engine=get_engine(app, variant), uploads=uploads, location=location, deadline=loop.time() + timeout)
+    try:
+        service.submit(job)
+    except Overloaded:
+        # Roughly one queue's worth of work (or of queued photos) has to drain before a retry can get in
+        return _error(503, "Too many requests in progress; try again shortly", **{"Retry-After": "5"})
+
+    match = rules_store.lookup(location["state"], location["city"] or None)
+    summary = {"location": location, "prompt_version": job.engine.prompt_version,
+               "recycling_rules": list(match.rules), "rules_level": match.level}
+    if "text/event-stream" in request.headers.get("accept", "") or request.query_params.get("stream"):
+        metrics.inc("ecogenie_api_requests_total", endpoint="classify", status="200")
+        return StreamingResponse(_sse(job, names, summary), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(names)
+    totals = BatchSummary()
+    status, error = 200, None
+    async for kind, index, payload in _events(job):
+        if kind == "done":
+            results[index] = _result_json(index, names[index], payload)
+            totals.add(payload, names[index])
+        elif kind in ("timeout", "expired"):
+            status, error = 504, "Deadline exceeded; results holds the images that finished"
+        elif kind == "failed":
+            status, error = 500, payload
+    metrics.inc("ecogenie_api_requests_total", endpoint="classify", status=str(status))
+    body = dict(summary, results=[r for r in results if r is not None], totals=totals.to_dict())
+    if error:
+        body["error"] = error
+    return JSONResponse(body, status_code=status)
+
+
+def _sse_event(name: str, data: Dict[str, Any]) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse(job: Job, names: List[str], summary: Dict[str, Any]):
+    """Server-sent events: "start", then "partial" and "result" per image, then "end" or "error" """
+    yield _sse_event("start", dict(summary, images=len(names)))
+    totals = BatchSummary()
+
+    def tally():
+        return {"results": totals.items + totals.duplicates, "totals": totals.to_dict()}
+
+    async for kind, index, payload in _events(job):
+        if kind == "partial":
+            yield _sse_event("partial", {"index": index, "text": payload})
+        elif kind == "done":
+            totals.add(payload, names[index])
+            yield _sse_event("result", _result_json(index, names[index], payload))
+        elif kind == "end":
+            yield _sse_event("end", tally())
+        elif kind == "failed":
+            yield _sse_event("error", dict(tally(), error=payload))
+        else:
+            yield _sse_event("error", dict(tally(), error="Deadline exceeded"))
+
+
+async def rules(request: Request):
+    state = request.query_params.get("state")
+    if not state:
+        return JSONResponse({"error": "Pass ?state=<state or UT>[&city=<city>]"}, status_code=400)
+    match = rules_store.lookup(state, request.query_params.get("city"))
+    metrics.inc("ecogenie_api_requests_total", endpoint="rules", status="200")
+    return JSONResponse({"state": match.state, "city": match.city, "level": match.level,
+                         "rules": list(match.rules)})
+
+
+async def states(request: Request):
+    return JSONResponse({"states": list(rules_store.states())})
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok", "workers": service.workers, "running": service.running,
+                         "queued": service.queued, "queue_size": service.queue_size,
+                         "tokens": token_ledger.stats()})
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app):
+    await service.start()
+    try:
+        yield
+    finally:
+        await service.stop()
+
+
+app = Starlette(routes=[
+    Route("/v1/classify", classify, methods=["POST"]),
+    Route("/v1/rules", rules),
+    Route("/v1/states", states),
+    Route("/healthz", health),
+], lifespan=_lifespan)
+
+
+_server_thread: Optional[threading.Thread] = None
+_server_lock = threading.Lock()
+
+
+def serve_in_background(port: int = API_PORT, host: str = API_HOST) -> None:
+    """Serve the API from a daemon thread of the current process (once per process)"""
+    global _server_thread
+    import uvicorn
+
+    with _server_lock:
+        if _server_thread is not None:
+            return
+        server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+
+        def run():
+            try:
+                server.run()
+            except SystemExit:
+                # uvicorn exits when the bind fails, e.g. when a sibling worker holds API_PORT; the UI keeps running
+                logger.warning("Classification API not started on port %d", port)
+
+        _server_thread = threading.Thread(target=run, name="classification-api", daemon=True)
+        _server_thread.start()
+
+
+def main(argv=None) -> int:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the scrap classification HTTP API")
+    parser.add_argument("--host", default=API_HOST, help="Interface to bind (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=API_PORT or 8080, help="Port (default: %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,178 @@
+"""Local cache for third-party assets (Lottie animations) used on the render path.
+
+Animations are vendored into assets/lottie/ at build time (`python assets.py vendor`)
+and served from memory after the first read, so rendering never waits on the CDN
+and air-gapped deployments work. When a copy is older than
+ASSET_REVALIDATE_SECONDS, a background thread revalidates it with
+If-None-Match / If-Modified-Since and stores a newer version under ASSET_CACHE_DIR.
+
+    python assets.py vendor    # download every asset into assets/lottie/
+    python assets.py status    # show what is cached locally
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+VENDOR_DIR = os.getenv("ASSET_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "lottie"))
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(".ecogenie", "assets"))
+ASSET_REVALIDATE_SECONDS = float(os.getenv("ASSET_REVALIDATE_SECONDS", str(24 * 3600)))
+# Never touch the network (air-gapped deployments); only vendored copies are used
+ASSET_OFFLINE = os.getenv("ASSET_OFFLINE", "").lower() in ("1", "true", "yes")
+
+LOTTIE_ASSETS: Dict[str, str] = {
+    "recycling": "https://lottie.host/65119e8e-f82c-4b53-b613-16096eb36a8e/Yrn7AjQUNK.json",
+}
+
+
+@dataclass
+class CachedAsset:
+    data: Optional[Any]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    checked_at: float = 0.0  # wall-clock time of the last successful fetch or revalidation
+
+
+def _paths(directory: str, name: str):
+    return os.path.join(directory, f"{name}.json"), os.path.join(directory, f"{name}.meta.json")
+
+
+def _read(directory: str, name: str) -> Optional[CachedAsset]:
+    data_path, meta_path = _paths(directory, name)
+    try:
+        with open(data_path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        meta = {}
+    return CachedAsset(data=data, etag=meta.get("etag"), last_modified=meta.get("last_modified"),
+                       checked_at=meta.get("checked_at", 0.0))
+
+
+def _write(directory: str, name: str, raw: bytes, asset: CachedAsset) -> None:
+    os.makedirs(directory, exist_ok=True)
+    data_path, meta_path = _paths(directory, name)
+    meta = {"etag": asset.etag, "last_modified": asset.last_modified, "checked_at": asset.checked_at}
+    for path, payload in ((data_path, raw), (meta_path, json.dumps(meta, indent=2).encode())):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp, path)
+
+
+class AssetCache:
+    """In-process memo over the vendored and refreshed copies of each asset"""
+
+    def __init__(self, urls: Dict[str, str] = LOTTIE_ASSETS, vendor_dir: str = VENDOR_DIR,
+                 cache_dir: str = ASSET_CACHE_DIR, revalidate_seconds: float = ASSET_REVALIDATE_SECONDS,
+                 offline: bool = ASSET_OFFLINE):
+        self.urls = urls
+        self.vendor_dir = vendor_dir
+        self.cache_dir = cache_dir
+        self.revalidate_seconds = revalidate_seconds
+        self.offline = offline
+        self._entries: Dict[str, CachedAsset] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _load(self, name: str) -> CachedAsset:
+        copies = [c for c in (_read(self.cache_dir, name), _read(self.vendor_dir, name)) if c is not None]
+        # The refreshed copy wins over the vendored one unless the build is newer
+        return max(copies, key=lambda c: c.checked_at) if copies else CachedAsset(data=None)
+
+    def get(self, name: str) -> Optional[Any]:
+        """Parsed asset, or None if no local copy exists yet. Never blocks on the network."""
+        entry = self._entries.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None:
+                    entry = self._entries[name] = self._load(name)
+        if not self.offline and time.time() - entry.checked_at > self.revalidate_seconds:
+            self._revalidate_in_background(name)
+        return entry.data
+
+    def _revalidate_in_background(self, name: str) -> None:
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+
+        def run():
+            try:
+                self.refresh(name)
+            finally:
+                with self._lock:
+                    self._pending.discard(name)
+
+        threading.Thread(target=run, name=f"asset-{name}", daemon=True).start()
+
+    def refresh(self, name: str, target_dir: Optional[str] = None, force: bool = False) -> bool:
+        """Conditional GET of one asset; True if a new version was stored"""
+        from resources import http_get
+
+        entry = self._entries.get(name) or self._load(name)
+        headers = {}
+        if not force and entry.data is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        try:
+            with metrics.span("lottie_fetch"):
+                response = http_get(self.urls[name], headers=headers)
+            if response.status_code == 304:
+                fresh = CachedAsset(entry.data, entry.etag, entry.last_modified, checked_at=time.time())
+                _write(target_dir or self.cache_dir, name, json.dumps(entry.data).encode(), fresh)
+                self._entries[name] = fresh
+                return False
+            response.raise_for_status()
+            fresh = CachedAsset(response.json(), response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                                checked_at=time.time())
+            _write(target_dir or self.cache_dir, name, response.content, fresh)
+        except (OSError, ValueError) as e:  # unreachable CDN, bad status, unwritable cache dir or broken JSON
+            logger.warning("Could not refresh asset %s: %s", name, e)
+            # Back off until the next revalidation period instead of retrying on every render
+            self._entries[name] = CachedAsset(entry.data, entry.etag, entry.last_modified, checked_at=time.time())
+            return False
+        self._entries[name] = fresh
+        return True
+
+
+asset_cache = AssetCache()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Vendor and inspect cached Lottie animations")
+    parser.add_argument("command", choices=["vendor", "status"])
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for name, url in LOTTIE_ASSETS.items():
+        if args.command == "vendor":
+            cache = AssetCache(cache_dir=VENDOR_DIR)
+            if cache.refresh(name, target_dir=VENDOR_DIR, force=True):
+                print(f"{name}: saved {url}")
+            else:
+                print(f"{name}: download failed")
+                failed += 1
+        else:
+            vendored, refreshed = _read(VENDOR_DIR, name), _read(ASSET_CACHE_DIR, name)
+            print(f"{name}: vendored={'yes' if vendored else 'no'} refreshed={'yes' if refreshed else 'no'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,36 @@
+"""Pack several images into one model request.
+
+A batched request asks for a JSON array with one record per image, each tagged
+with its image_number; scrap_record.parse_batch splits the answer back per image.
+"""
+import os
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Sequence
+
+# Images per model request; 1 keeps the one-call-per-image behaviour
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+
+# Part of every prompt version (see prompts.PromptTemplate), so editing it retires old batched answers
+BATCH_INSTRUCTIONS = """
+You will receive {count} images, labelled "Image 1" to "Image {count}". Classify every image separately and return a JSON array with exactly one object per image, in order, with "image_number" set to the image's number.
+"""
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Consecutive lists of up to size items; works lazily on any iterable"""
+    iterator = iter(items)
+    size = max(1, size)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batch_contents(prompt: str, parts: Sequence[Any]) -> List[Any]:
+    """Contents for one generate_content call covering all parts (one per image)"""
+    contents: List[Any] = [prompt + BATCH_INSTRUCTIONS.format(count=len(parts))]
+    for number, part in enumerate(parts, start=1):
+        contents.append(f"Image {number}:")
+        contents.append(part)
+    return contents
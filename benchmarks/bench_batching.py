@@ -0,0 +1,112 @@
+"""Compare tokens and latency of batched prompts against one request per image.
+
+Calls the real model (API_KEY must be set) without any caching:
+
+    python benchmarks/bench_batching.py --images path/to/photos --batch-size 4
+    python benchmarks/bench_batching.py --images path/to/photos --variant compact
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchutil import SAMPLE_IMAGE
+
+from batching import batch_contents, chunked
+from preprocess import model_part, preprocess_image
+from prompts import PROMPTS, VARIANTS
+from scrap_core import get_engine
+from scrap_record import parse_batch, parse_record
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_images(path: str, count: int):
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        files = [path]
+    # Repeat the available files if there are fewer than requested
+    files = (files * count)[:count]
+    prepared = []
+    for f in files:
+        with open(f, "rb") as fh:
+            prepared.append(preprocess_image(fh))
+    return prepared
+
+
+def usage(response) -> dict:
+    meta = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(meta, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(meta, "candidates_token_count", 0) or 0,
+    }
+
+
+def run_mode(model, template, prompt: str, images, batch_size: int) -> dict:
+    latencies, prompt_tokens, output_tokens, requests_made, parsed = [], 0, 0, 0, 0
+    started = time.perf_counter()
+    for unit in chunked(images, batch_size):
+        parts = [model_part(image) for image in unit]
+        if len(unit) == 1:
+            contents = [prompt, parts[0]]
+        else:
+            contents = batch_contents(prompt, parts)
+        config = template.generation_config(len(unit))
+        t0 = time.perf_counter()
+        response = model.generate_content(contents, generation_config=config)
+        latencies.append(time.perf_counter() - t0)
+        requests_made += 1
+        counts = usage(response)
+        prompt_tokens += counts["prompt_tokens"]
+        output_tokens += counts["output_tokens"]
+        if len(unit) > 1:
+            parsed += len(parse_batch(response.text, len(unit)))
+        else:
+            try:
+                parse_record(response.text)
+                parsed += 1
+            except ValueError:
+                pass
+    return {
+        "batch_size": batch_size,
+        "requests": requests_made,
+        "images": len(images),
+        "images_parsed": parsed,
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "mean_request_seconds": round(statistics.mean(latencies), 3),
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "tokens_per_image": round((prompt_tokens + output_tokens) / len(images), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default=SAMPLE_IMAGE, help="Image file or directory (default: bundled sample)")
+    parser.add_argument("--count", type=int, default=8, help="Number of images to classify (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per batched request (default: %(default)s)")
+    parser.add_argument("--state", default="Maharashtra")
+    parser.add_argument("--app", default="app", choices=sorted(PROMPTS), help="Front end whose prompt is used")
+    parser.add_argument("--variant", default="full", choices=sorted(VARIANTS), help="Prompt variant")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    engine = get_engine(args.app, args.variant)
+    images = load_images(args.images, args.count)
+    prompt = engine.build_prompt(args.state)
+    report = {
+        "prompt_version": engine.prompt_version,
+        "per_image": run_mode(engine.model, engine.prompt, prompt, images, 1),
+        "batched": run_mode(engine.model, engine.prompt, prompt, images, args.batch_size),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
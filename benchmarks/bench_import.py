@@ -0,0 +1,82 @@
+"""Cold-start benchmark: how long a fresh interpreter takes to import each module.
+
+Every sample runs in a new Python process (like a freshly scheduled container),
+and one extra run with -X importtime lists the slowest imports, so a heavy SDK
+that sneaks back into module scope shows up by name.
+
+    python benchmarks/bench_import.py --output bench_import.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchutil import REPO_ROOT, environment, percentiles, write_report
+
+# Loaded on first use only; importing any of them at startup is a regression
+DEFERRED = ["google.generativeai", "bokeh", "streamlit_bokeh_events", "streamlit_lottie", "geopy", "geocoder",
+            "requests"]
+
+
+def run_import(module: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, MODEL_BACKEND=os.getenv("MODEL_BACKEND", "gemini"), RESULT_STORE_PATH="off")
+    code = f"import sys, {module}; print(','.join(sorted(sys.modules)))"
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=REPO_ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def slowest_imports(stderr: str, top: int):
+    """Top-level packages by cumulative import time, from -X importtime output"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = max(totals.get(package, 0), int(cumulative))
+    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {name: round(us / 1000, 1) for name, us in ranked}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app modules")
+    parser.add_argument("--output", default="bench_import.json", help="JSON report path (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=10, help="Fresh interpreters per module (default: %(default)s)")
+    parser.add_argument("--modules", default="app,waste_info,classify_cli", help="Comma-separated modules to import")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list per module")
+    args = parser.parse_args()
+
+    baseline = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline.append(time.perf_counter() - t0)
+
+    modules = {}
+    for module in args.modules.split(","):
+        samples = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            loaded = run_import(module).stdout.strip().split(",")
+            samples.append(time.perf_counter() - t0)
+        profile = run_import(module, "-X", "importtime")
+        modules[module] = {
+            "wall": percentiles(samples),
+            "slowest_imports_ms": slowest_imports(profile.stderr, args.top),
+            "deferred_but_loaded": sorted(set(DEFERRED) & set(loaded)),
+        }
+
+    write_report({
+        "benchmark": "import",
+        "environment": environment(),
+        "config": {"repeat": args.repeat},
+        "interpreter_startup": percentiles(baseline),
+        "modules": modules,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
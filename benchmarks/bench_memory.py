@@ -0,0 +1,102 @@
+"""Peak-memory benchmark: many simulated sessions uploading phone-sized photos at once.
+
+Each session does what a Streamlit run does (keeps its upload buffers, prepares
+them through the shared cache, admits them against the memory budget and
+classifies them with the FakeBackend) while a sampler records the process RSS.
+With --max-peak-mb the run fails when peak RSS goes over the limit, so it can
+guard against regressions in CI.
+
+    python benchmarks/bench_memory.py --sessions 16 --images 20 --output bench_memory.json
+    MEMORY_BUDGET_MB=64 python benchmarks/bench_memory.py --max-peak-mb 400
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ["MODEL_BACKEND"] = "fake"  # every engine here runs on FakeBackend
+os.environ["RESULT_STORE_PATH"] = "off"
+os.environ.setdefault("MODEL_RPM", "0")
+os.environ.setdefault("MODEL_TPM", "0")
+
+from benchutil import (RssSampler, current_rss_mb, environment, peak_rss_mb, percentiles, phone_photos,  # noqa: E402
+                       write_report)
+
+from concurrency import run_bounded  # noqa: E402
+from memory_budget import memory_budget  # noqa: E402
+from model_backend import FakeBackend  # noqa: E402
+from preprocess import prepared_cache, preprocess_cached  # noqa: E402
+from prompts import PROMPTS  # noqa: E402
+from scrap_core import get_engine  # noqa: E402
+
+
+def run_session(engine, uploads, max_in_flight: int, outcome: dict):
+    t0 = time.perf_counter()
+    with memory_budget.session() as allowance:
+        kept = (allowance.admit(o.value) for o in run_bounded(preprocess_cached, uploads, max_in_flight) if o.ok)
+        images = [image for image in kept if image is not None]
+        results = engine.classify(images, {"state": "Karnataka"}, max_in_flight=max_in_flight)
+        outcome["admitted"] = len(images)
+        outcome["errors"] = sum(1 for r in results if r["error"])
+        outcome["held_mb"] = allowance.used / (1024 * 1024)
+    outcome["seconds"] = time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS under many concurrent sessions")
+    parser.add_argument("--output", default="bench_memory.json", help="JSON report path (default: %(default)s)")
+    parser.add_argument("--sessions", type=int, default=16, help="Concurrent sessions (default: %(default)s)")
+    parser.add_argument("--images", type=int, default=20, help="Photos per session (default: %(default)s)")
+    parser.add_argument("--edge", type=int, default=3000, help="Longest edge of each photo in pixels")
+    parser.add_argument("--latency", default="lognormal:0.8:0.3", help="FakeBackend latency distribution")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Model calls in flight per session")
+    parser.add_argument("--max-peak-mb", type=float, default=0, help="Fail if peak RSS exceeds this (0: report only)")
+    parser.add_argument("--app", default="app", choices=sorted(PROMPTS))
+    args = parser.parse_args()
+
+    engine = get_engine(args.app)
+    engine.model = FakeBackend(latency=args.latency)
+    # Upload buffers exist before any session starts, like Streamlit's UploadedFile objects
+    uploads = [phone_photos(args.images, args.edge, seed) for seed in range(args.sessions)]
+    upload_mb = sum(len(data) for session in uploads for data in session) / (1024 * 1024)
+    baseline = current_rss_mb()
+
+    outcomes = [{} for _ in uploads]
+    threads = [threading.Thread(target=run_session, args=(engine, session, args.max_in_flight, outcome))
+               for session, outcome in zip(uploads, outcomes)]
+    t0 = time.perf_counter()
+    with RssSampler() as sampler:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - t0
+
+    peak = sampler.peak
+    report = {
+        "benchmark": "memory",
+        "environment": environment(),
+        "config": {"sessions": args.sessions, "images": args.images, "edge": args.edge, "latency": args.latency,
+                   "max_in_flight": args.max_in_flight, "app": args.app},
+        "upload_buffers_mb": round(upload_mb, 1),
+        "baseline_rss_mb": round(baseline, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_above_baseline_mb": round(peak - baseline, 1),
+        "per_session_mb": round((peak - baseline) / max(1, args.sessions), 2),
+        "max_rss_mb": peak_rss_mb(),
+        "seconds": round(elapsed, 3),
+        "session_latency": percentiles([o["seconds"] for o in outcomes]),
+        "images_admitted": sum(o["admitted"] for o in outcomes),
+        "errors": sum(o["errors"] for o in outcomes),
+        "budget": memory_budget.stats(),
+        "prepared_cache_entries": len(prepared_cache),
+    }
+    write_report(report, args.output)
+    if args.max_peak_mb and peak > args.max_peak_mb:
+        print(f"Peak RSS {peak:.1f} MB is over the {args.max_peak_mb:.1f} MB limit", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Per-stage benchmark of the classification pipeline, fully offline.
+
+Stages: decode (JPEG/PNG/WebP), preprocessing, prompt construction, model call
+through the latency-simulating FakeBackend, response parsing and render prep.
+Then whole-pipeline throughput at several concurrency levels, and peak RSS.
+
+    python benchmarks/bench_pipeline.py --output bench_pipeline.json
+
+Compare two runs with `diff` or any JSON diff tool; keys are sorted.
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+os.environ["MODEL_BACKEND"] = "fake"  # every engine here runs on FakeBackend
+os.environ["RESULT_STORE_PATH"] = "off"  # measure the pipeline, not the disk cache
+os.environ.setdefault("MODEL_RPM", "0")  # the fake model has no quota
+os.environ.setdefault("MODEL_TPM", "0")
+
+from benchutil import SAMPLE_IMAGE, environment, peak_rss_mb, percentiles, write_report  # noqa: E402
+
+from PIL import Image  # noqa: E402
+
+from batching import batch_contents  # noqa: E402
+from model_backend import FakeBackend  # noqa: E402
+from preprocess import model_part, preprocess_image  # noqa: E402
+from prompts import PROMPTS  # noqa: E402
+from scrap_core import get_engine  # noqa: E402
+from scrap_record import GENERATION_CONFIG, parse_record  # noqa: E402
+from scrap_ui import result_html  # noqa: E402
+
+
+def timed(func, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - t0)
+    return percentiles(samples)
+
+
+def encoded_samples(edge: int):
+    """The bundled sample scaled up to a phone-photo edge, encoded as JPEG, PNG and WebP"""
+    base = Image.open(SAMPLE_IMAGE).convert("RGB")
+    scale = edge / max(base.size)
+    base = base.resize((round(base.width * scale), round(base.height * scale)), Image.BICUBIC)
+    samples = {}
+    for fmt in ("JPEG", "PNG", "WEBP"):
+        out = io.BytesIO()
+        base.save(out, format=fmt, quality=90)
+        samples[fmt] = out.getvalue()
+    return samples
+
+
+def unique_uploads(count: int, seed: int):
+    """Distinct noise images, so neither the cache nor near-duplicate grouping kicks in"""
+    rng = random.Random(seed)
+    uploads = []
+    for _ in range(count):
+        image = Image.frombytes("RGB", (256, 256), rng.randbytes(256 * 256 * 3))
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=85)
+        uploads.append(out.getvalue())
+    return uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the classification pipeline")
+    parser.add_argument("--output", default="bench_pipeline.json", help="JSON report path (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=30, help="Samples per stage (default: %(default)s)")
+    parser.add_argument("--edge", type=int, default=3000, help="Longest edge of the decode samples in pixels")
+    parser.add_argument("--latency", default="lognormal:0.8:0.3", help="FakeBackend latency distribution")
+    parser.add_argument("--images", type=int, default=32, help="Images per throughput run (default: %(default)s)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--app", default="app", choices=sorted(PROMPTS))
+    args = parser.parse_args()
+
+    engine = get_engine(args.app)
+    stages = {}
+
+    samples = encoded_samples(args.edge)
+    for fmt, data in samples.items():
+        stages[f"decode_{fmt.lower()}"] = timed(lambda: Image.open(io.BytesIO(data)).load(), args.repeat)
+    for fmt, data in samples.items():
+        stages[f"preprocess_{fmt.lower()}"] = timed(lambda: preprocess_image(data), args.repeat)
+
+    prepared = preprocess_image(samples["JPEG"])
+    stages["prompt_single"] = timed(lambda: [engine.build_prompt("Karnataka"), model_part(prepared)],
+                                    args.repeat * 10)
+    stages["prompt_batch_4"] = timed(lambda: batch_contents(engine.build_prompt("Karnataka"),
+                                                            [model_part(prepared)] * 4), args.repeat * 10)
+
+    stub = FakeBackend(latency=args.latency, seed=1)
+    contents = [engine.build_prompt("Karnataka"), model_part(prepared)]
+    stages["model_call_stub"] = timed(lambda: stub.generate_content(contents, generation_config=GENERATION_CONFIG),
+                                      args.repeat)
+
+    answer = stub.generate_content(contents, generation_config=GENERATION_CONFIG).text
+    stages["parse_response"] = timed(lambda: parse_record(answer), args.repeat * 10)
+    record = parse_record(answer)
+    stages["render_prep"] = timed(lambda: result_html(record), args.repeat * 10)
+
+    throughput = {}
+    for level in (int(c) for c in args.concurrency.split(",")):
+        engine.model = FakeBackend(latency=args.latency, seed=level)
+        uploads = unique_uploads(args.images, seed=level)
+        t0 = time.perf_counter()
+        images = [preprocess_image(data) for data in uploads]
+        results = engine.classify(images, {"state": "Karnataka"}, max_in_flight=level)
+        elapsed = time.perf_counter() - t0
+        throughput[str(level)] = {
+            "images": len(results),
+            "errors": sum(1 for r in results if r["error"]),
+            "seconds": round(elapsed, 3),
+            "images_per_second": round(len(results) / elapsed, 2),
+        }
+
+    write_report({
+        "benchmark": "pipeline",
+        "environment": environment(),
+        "config": {"repeat": args.repeat, "edge": args.edge, "latency": args.latency, "images": args.images,
+                   "app": args.app},
+        "stages": stages,
+        "throughput": throughput,
+        "peak_rss_mb": peak_rss_mb(),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Load test: N simulated users driving the Streamlit page headlessly in one worker process.
+
+Each user is an AppTest session running the real app script. The users open the
+page, upload photos, press "Detect My Location" (app.py only), change the location
+by hand and trigger one more idle rerun, with think time in between. The model
+is the FakeBackend and the geocoder is a local stub with configurable latency,
+so only the worker itself is measured.
+
+Photos go through AppTest's file uploader. The Bokeh geolocation button is a
+custom component AppTest cannot click, so this script replaces the component
+with a stand-in that returns the event the simulated user put in session state.
+
+The report has per-step latency percentiles, throughput, script runs per
+interaction and RSS growth. Applying a manual location costs two runs (the
+button's run, then st.rerun), so a baseline is a little over 1.0; a rise from
+one release to the next means new redundant reruns.
+
+    python benchmarks/bench_sessions.py --users 8 --rounds 2 --output bench_sessions.json
+    python benchmarks/bench_sessions.py --app waste_info --users 16 --latency lognormal:1.2:0.4
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import threading
+import time
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ["RESULT_STORE_PATH"] = "off"
+os.environ.setdefault("MODEL_RPM", "0")
+os.environ.setdefault("MODEL_TPM", "0")
+
+from benchutil import (REPO_ROOT, RssSampler, current_rss_mb, environment, percentiles,  # noqa: E402
+                       phone_photos, write_report)
+
+import metrics  # noqa: E402
+from scrap_core import get_engine  # noqa: E402
+
+APP_SCRIPTS = {"app": "app.py", "waste_info": "waste_info.py"}
+STATES = ["Karnataka", "Tamil Nadu", "Kerala", "Gujarat", "Punjab", "Assam"]
+
+
+def allow_concurrent_apptests():
+    """Let several AppTest sessions run at once in this process.
+
+    AppTest installs a mock Runtime singleton for every run and clears it when the
+    run ends, which breaks any other session still running. Its runs are pointed
+    at a subclass instead, while the real singleton stays on one shared mock.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test
+
+    class _SessionRuntime(Runtime):
+        pass
+
+    # The same managers AppTest gives each run, shared by all of them
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = app_test.MediaFileManager(app_test.MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = app_test.MemoryCacheStorageManager()
+    if hasattr(app_test, "DataframeSourceManager"):
+        shared.dataframe_source_mgr = app_test.DataframeSourceManager()
+    Runtime._instance = shared
+    app_test.Runtime = _SessionRuntime
+    # Each run sets this option and restores the previous value; keep that value True
+    config.set_option("global.appTest", True)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+
+def stub_geocoder(latency: float):
+    """Replace the network lookups with local answers that take `latency` seconds"""
+    import geocoding
+
+    def reverse_geocode_online(lat, lon, timeout=None):
+        time.sleep(latency)
+        return {"city": "Bhopal", "state": "Madhya Pradesh", "country": "India"}
+
+    def ip_location(timeout=None):
+        time.sleep(latency)
+        metrics.inc("ecogenie_geocode_requests_total", source="ip")
+        return {"city": "Pune", "state": "Maharashtra", "country": "India"}
+
+    geocoding.reverse_geocode_online = reverse_geocode_online
+    geocoding.ip_location = ip_location
+
+
+def stub_location_button():
+    """Replace the Bokeh geolocation component with one that returns the user's queued event"""
+    import streamlit as st
+    import streamlit_bokeh_events
+
+    def streamlit_bokeh_events_stub(bokeh_plot=None, events="", key=None, **kwargs):
+        return st.session_state.get("bench_geolocation")
+
+    # app.py imports the component when the page runs, so patching the module is enough
+    streamlit_bokeh_events.streamlit_bokeh_events = streamlit_bokeh_events_stub
+
+
+def widget(widgets, label: str):
+    return next(w for w in widgets if w.label == label)
+
+
+def set_location_manually(at, app: str, city: str, state: str):
+    if app == "waste_info":
+        box = widget(at.checkbox, "Enter location manually?")
+        if not box.value:
+            box.check().run()
+        widget(at.text_input, "Enter City").input(city)
+        widget(at.selectbox, "Select State").select(state)
+        at.run()
+    else:
+        widget(at.text_input, "Enter City").input(city)
+        widget(at.selectbox, "Select State").select(state)
+        widget(at.button, "Apply Custom Location").click()
+        at.run()
+
+
+def simulate_user(user: int, args, record):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(user)
+    at = AppTest.from_file(os.path.join(REPO_ROOT, APP_SCRIPTS[args.app]), default_timeout=args.timeout)
+
+    def step(name: str, action):
+        time.sleep(rng.uniform(0, 2 * args.think_time))
+        t0 = time.perf_counter()
+        try:
+            action()
+            error = "; ".join(str(e.value) for e in at.exception) or None
+        except Exception as e:  # a timeout or a widget that did not render
+            error = f"{type(e).__name__}: {e}"
+        record(name, time.perf_counter() - t0, error)
+
+    step("open", at.run)
+    for round_ in range(args.rounds):
+        photos = phone_photos(args.images, args.edge, seed=user * args.rounds + round_)
+        step("upload", lambda: widget(at.file_uploader, "Upload images of scrap items").set_value(
+            [(f"user{user}-{i}.jpg", data, "image/jpeg") for i, data in enumerate(photos)]).run())
+        if args.app == "app":
+            # Anywhere in India: bundled states resolve offline, the rest go to the stubbed network lookup
+            at.session_state["bench_geolocation"] = {
+                "GET_LOCATION": {"lat": rng.uniform(8.5, 30.0), "lon": rng.uniform(70.0, 88.0)}}
+            step("geolocate", at.run)
+        step("manual_location", lambda: set_location_manually(at, args.app, "Testnagar", rng.choice(STATES)))
+        step("idle_rerun", at.run)
+
+
+def counter(name: str, **labels) -> float:
+    return metrics.registry.counter_value(name, **labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent Streamlit users against one worker")
+    parser.add_argument("--output", default="bench_sessions.json", help="JSON report path (default: %(default)s)")
+    parser.add_argument("--app", default="app", choices=sorted(APP_SCRIPTS), help="Front end to drive")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=2, help="Upload rounds per user (default: %(default)s)")
+    parser.add_argument("--images", type=int, default=4, help="Photos per upload (default: %(default)s)")
+    parser.add_argument("--edge", type=int, default=1600, help="Longest edge of each photo in pixels")
+    parser.add_argument("--latency", default="lognormal:0.8:0.3", help="FakeBackend latency distribution")
+    parser.add_argument("--geocode-latency", type=float, default=0.3, help="Seconds per stubbed geocoder lookup")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean pause between a user's steps")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds one script run may take")
+    args = parser.parse_args()
+
+    os.environ.setdefault("FAKE_LATENCY", args.latency)
+    metrics.enable()
+    stub_geocoder(args.geocode_latency)
+    stub_location_button()
+    allow_concurrent_apptests()
+
+    latencies, errors, lock = {}, [], threading.Lock()
+
+    def record(step: str, seconds: float, error):
+        with lock:
+            latencies.setdefault(step, []).append(seconds)
+            if error:
+                errors.append({"step": step, "error": error[:300]})
+
+    threads = [threading.Thread(target=simulate_user, args=(user, args, record), name=f"user-{user}")
+               for user in range(args.users)]
+    baseline = current_rss_mb()
+    t0 = time.perf_counter()
+    with RssSampler() as sampler:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+
+    page_runs = counter("ecogenie_page_runs_total", prompt=get_engine(args.app).prompt_version)
+    interactions = sum(len(samples) for samples in latencies.values())
+    images = {source: counter("ecogenie_images_total", source=source)
+              for source in ("cache", "store", "near_duplicate", "preclassifier", "model")}
+    write_report({
+        "benchmark": "sessions",
+        "environment": environment(),
+        "config": {"app": args.app, "users": args.users, "rounds": args.rounds, "images": args.images,
+                   "edge": args.edge, "latency": os.environ["FAKE_LATENCY"],
+                   "geocode_latency": args.geocode_latency, "think_time": args.think_time},
+        "seconds": round(elapsed, 3),
+        "steps": {step: percentiles(samples) for step, samples in sorted(latencies.items())},
+        "throughput": {
+            "interactions_per_second": round(interactions / elapsed, 2),
+            "images_per_second": round(args.users * args.rounds * args.images / elapsed, 2),
+        },
+        "reruns": {
+            "page_runs": page_runs,
+            "interactions": interactions,
+            "runs_per_interaction": round(page_runs / interactions, 2) if interactions else 0.0,
+        },
+        "images": images,
+        "model_requests": counter("ecogenie_model_requests_total", kind="single", outcome="ok")
+        + counter("ecogenie_model_requests_total", kind="batch", outcome="ok"),
+        "geocode_requests": {source: counter("ecogenie_geocode_requests_total", source=source)
+                             for source in ("cache", "offline", "network", "ip")},
+        "rss_mb": {
+            "baseline": round(baseline, 1),
+            "peak": round(sampler.peak, 1),
+            "after": round(current_rss_mb(), 1),
+            "growth": round(current_rss_mb() - baseline, 1),
+        },
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
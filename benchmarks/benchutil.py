@@ -0,0 +1,125 @@
+"""Helpers shared by the benchmark scripts"""
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Sequence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+SAMPLE_IMAGE = os.path.join(REPO_ROOT, "cell_phone.webp")
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99 (nearest rank) and mean of samples, in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(rank(50) * 1000, 3),
+        "p95_ms": round(rank(95) * 1000, 3),
+        "p99_ms": round(rank(99) * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def current_rss_mb() -> float:
+    """Resident set size now (Linux); falls back to the peak elsewhere"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+class RssSampler:
+    """Samples current_rss_mb() in the background while the with-block runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._done.is_set():
+            self.samples.append(current_rss_mb())
+            self._done.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.samples.append(current_rss_mb())
+        return False
+
+    @property
+    def peak(self) -> float:
+        return max(self.samples)
+
+
+def phone_photos(count: int, edge: int, seed: int) -> List[bytes]:
+    """Distinct JPEGs at a phone-camera resolution: the sample blended with a random block pattern.
+
+    The pattern is coarse enough to change the perceptual hash, so near-duplicate
+    grouping does not merge the photos.
+    """
+    from PIL import Image
+
+    rng = random.Random(seed)
+    base = Image.open(SAMPLE_IMAGE).convert("RGB")
+    scale = edge / max(base.size)
+    base = base.resize((round(base.width * scale), round(base.height * scale)), Image.BILINEAR)
+    uploads = []
+    for _ in range(count):
+        pattern = Image.frombytes("RGB", (9, 8), rng.randbytes(9 * 8 * 3)).resize(base.size, Image.NEAREST)
+        photo = Image.blend(base, pattern, 0.5)
+        out = io.BytesIO()
+        photo.save(out, format="JPEG", quality=90)
+        uploads.append(out.getvalue())
+    return uploads
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def write_report(report: dict, output: str) -> None:
+    """Write the JSON report (sorted keys, so two releases diff cleanly) and echo it"""
+    text = json.dumps(report, indent=2, sort_keys=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        fh.write(text + "\n")
+    print(text)
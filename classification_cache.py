@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from PIL import Image
+
+import metrics
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "0")) or None
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of the decoded pixels, independent of file name or container"""
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def cache_key(digest: str, state: str, prompt_version: str) -> Tuple[str, str, str]:
+    return (digest, state, prompt_version)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a size bound and an optional TTL (in seconds).
+
+    With weigh, weight is the running total of weigh(value) over the entries held.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: Optional[float] = CACHE_TTL_SECONDS,
+                 name: str = "classification", weigh: Optional[Callable[[Any], int]] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._weigh = weigh
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc("ecogenie_cache_requests_total", cache=self.name, result="hit")
+                    return value
+                self._drop(key)
+            self.misses += 1
+            metrics.inc("ecogenie_cache_requests_total", cache=self.name, result="miss")
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic(), value)
+            if self._weigh is not None:
+                self.weight += self._weigh(value)
+            while len(self._data) > self.max_entries:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key: Hashable) -> None:
+        _, value = self._data.pop(key)
+        if self._weigh is not None:
+            self.weight -= self._weigh(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Process-wide cache of model answers keyed by (image digest, state, prompt version)
+classification_cache = LRUCache()
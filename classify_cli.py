@@ -0,0 +1,185 @@
+"""Classify a directory (or manifest) of scrap photos without the Streamlit UI.
+
+Results are appended to a JSON Lines file as each image finishes, so a crash
+loses nothing that was already written, and a rerun with the same --output
+skips every image whose file digest is already there:
+
+    python classify_cli.py photos/ --state Karnataka --output results.jsonl
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+from typing import Iterable, Iterator, List, Optional, Set
+
+from batching import BATCH_SIZE, chunked
+from concurrency import run_bounded
+from preclassifier import get_preclassifier
+from preprocess import preprocess_image
+from report import BatchSummary
+from prompts import PROMPTS, VARIANTS, token_ledger
+from scrap_core import get_engine
+
+logger = logging.getLogger("classify_cli")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def iter_image_paths(sources: Iterable[str]) -> Iterator[str]:
+    """Image files under each directory (sorted walk), or listed in a manifest file"""
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif source.lower().endswith(IMAGE_EXTENSIONS):
+            yield source
+        else:
+            # Manifest: one image path per line, relative to the manifest's directory
+            base = os.path.dirname(os.path.abspath(source))
+            with open(source, encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def completed_digests(output: str, prompt_version: str) -> Set[str]:
+    """File digests already classified successfully with this prompt version in an existing output file"""
+    done: Set[str] = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+            if row.get("error") is None and row.get("digest") and row.get("prompt_version") == prompt_version:
+                done.add(row["digest"])
+    return done
+
+
+def open_output(output: str):
+    """Open for appending, first terminating a line left incomplete by a crash"""
+    needs_newline = False
+    if os.path.exists(output) and os.path.getsize(output) > 0:
+        with open(output, "rb") as fh:
+            fh.seek(-1, os.SEEK_END)
+            needs_newline = fh.read(1) != b"\n"
+    fh = open(output, "a", encoding="utf-8")
+    if needs_newline:
+        fh.write("\n")
+    return fh
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Classify scrap photos in bulk and write JSON Lines results")
+    parser.add_argument("sources", nargs="+", help="Image directories, image files or manifest files")
+    parser.add_argument("--output", "-o", required=True, help="JSON Lines file to append results to")
+    parser.add_argument("--state", default="Maharashtra", help="State whose recycling rules apply")
+    parser.add_argument("--city", default="", help="City, recorded with each result")
+    parser.add_argument("--concurrency", type=int, default=4, help="Model calls in flight (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per model request")
+    parser.add_argument("--chunk", type=int, default=32, help="Images read into memory at a time")
+    parser.add_argument("--no-resume", action="store_true", help="Classify images even if already in --output")
+    parser.add_argument("--app", default="app", choices=sorted(PROMPTS), help="Front end whose prompt is used")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), help="Prompt variant (default: PROMPT_VARIANT)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    engine = get_engine(args.app, args.variant)
+    location = {"city": args.city, "state": args.state, "country": "India"}
+
+    skip = set() if args.no_resume else completed_digests(args.output, engine.prompt_version)
+    if skip:
+        logger.info("Resuming: %d images already in %s", len(skip), args.output)
+
+    written = failed = skipped = 0
+    summary = BatchSummary()  # this run's images only; "python report.py" totals a whole output file
+    with open_output(args.output) as out:
+        for paths in chunked(iter_image_paths(args.sources), args.chunk):
+            digests, todo = {}, []
+            for path, outcome in zip(paths, run_bounded(file_digest, paths, args.concurrency)):
+                if not outcome.ok:
+                    out.write(json.dumps({"path": path, "digest": None, "error": outcome.error}) + "\n")
+                    failed += 1
+                elif outcome.value in skip:
+                    skipped += 1
+                else:
+                    digests[path] = outcome.value
+                    todo.append(path)
+
+            prepared = run_bounded(lambda p: preprocess_image(read_file(p)), todo, args.concurrency)
+            images, image_paths = [], []
+            for path, outcome in zip(todo, prepared):
+                if outcome.ok:
+                    images.append(outcome.value)
+                    image_paths.append(path)
+                else:
+                    out.write(json.dumps({"path": path, "digest": digests[path], "error": outcome.error}) + "\n")
+                    failed += 1
+
+            for kind, index, result in engine.classify_stream(images, location, args.concurrency,
+                                                                 args.batch_size):
+                if kind != "done":
+                    continue
+                path = image_paths[index]
+                duplicate_of = result["duplicate_of"]
+                row = {
+                    "path": path,
+                    "digest": digests[path],
+                    "state": args.state,
+                    "city": args.city,
+                    "prompt_version": engine.prompt_version,
+                    "record": result["record"].to_dict() if result["record"] else None,
+                    "error": result["error"],
+                    "duplicate_of": image_paths[duplicate_of] if duplicate_of is not None else None,
+                    "matched_locally": result["matched_locally"],
+                    "recycling_rules": result["recycling_rules"],
+                }
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                summary.add(result, path)
+                if result["error"]:
+                    failed += 1
+                else:
+                    written += 1
+                    skip.add(digests[path])
+            # Drop decoded images before reading the next chunk
+            del images, prepared
+
+    logger.info("Done: %d classified, %d failed, %d skipped", written, failed, skipped)
+    if summary.classified:
+        logger.info("Estimated value %s; %d recyclable, %d hazardous; by material: %s", summary.value_range,
+                    summary.recyclable, len(summary.hazardous),
+                    ", ".join(f"{row['material']} {row['items']}" for row in summary.material_rows()))
+    for version, usage in token_ledger.stats().items():
+        logger.info("Tokens for %s: %d in, %d out over %d calls (%.0f in, %.0f out per call)", version,
+                    usage["input_tokens"], usage["output_tokens"], usage["calls"], usage["input_per_call"],
+                    usage["output_per_call"])
+    preclassifier = get_preclassifier()
+    if preclassifier is not None:
+        logger.info("Pre-classifier: %s", preclassifier.stats())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
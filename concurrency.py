@@ -0,0 +1,85 @@
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+@dataclass
+class ItemResult:
+    """Outcome of one item in a batch: either a value or the error that stopped it"""
+    index: int
+    value: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_bounded(func: Callable[[Any], Any], items: Iterable[Any],
+                max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> List[ItemResult]:
+    """Run func over items on a bounded thread pool.
+
+    Results come back in input order. A failing item is recorded on its
+    ItemResult instead of aborting the rest of the batch.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def _run(index: int, item: Any) -> ItemResult:
+        try:
+            return ItemResult(index=index, value=func(item))
+        except Exception as e:
+            logger.warning("Item %d failed: %s", index, e)
+            return ItemResult(index=index, error=str(e) or e.__class__.__name__)
+
+    workers = max(1, min(max_in_flight, len(items)))
+    if workers == 1:
+        return [_run(i, item) for i, item in enumerate(items)]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify") as pool:
+        futures = [pool.submit(_run, i, item) for i, item in enumerate(items)]
+        return [f.result() for f in futures]
+
+
+def iter_bounded(func: Callable[[Any, Callable[[Any], None]], Any], items: Iterable[Any],
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> Iterator[Tuple[int, Any, Optional[ItemResult]]]:
+    """Streaming counterpart of run_bounded.
+
+    func is called as func(item, emit) and may call emit(partial) any number of
+    times while it works. Yields (index, partial, None) for every emitted partial
+    and (index, None, ItemResult) once an item finishes, in completion order, so
+    the caller can render each item as soon as it has something to show.
+    """
+    items = list(items)
+    if not items:
+        return
+    events: "queue.Queue[Tuple[int, Any, Optional[ItemResult]]]" = queue.Queue()
+
+    def _run(index: int, item: Any) -> None:
+        try:
+            value = func(item, lambda partial: events.put((index, partial, None)))
+            events.put((index, None, ItemResult(index=index, value=value)))
+        except Exception as e:
+            logger.warning("Item %d failed: %s", index, e)
+            events.put((index, None, ItemResult(index=index, error=str(e) or e.__class__.__name__)))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(items))), thread_name_prefix="classify")
+    try:
+        for i, item in enumerate(items):
+            pool.submit(_run, i, item)
+        remaining = len(items)
+        while remaining:
+            event = events.get()
+            if event[2] is not None:
+                remaining -= 1
+            yield event
+    finally:
+        # A consumer that stops early (e.g. a Streamlit rerun) should not wait for queued items
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,208 @@
+"""Perceptual hashing to spot near-identical photos of the same item.
+
+Hashes are 64-bit integers computed over a small grayscale thumbnail, so two
+shots of the same object a few pixels apart land within a small Hamming
+distance of each other.
+"""
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Largest Hamming distance (out of 64 bits) still treated as the same item; negative disables dedup
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+DEDUP_HASH = os.getenv("DEDUP_HASH", "dhash")
+DEDUP_INDEX_MAX_ENTRIES = int(os.getenv("DEDUP_INDEX_MAX_ENTRIES", "4096"))
+
+_HASH_SIZE = 8
+_BIT_WEIGHTS = (1 << np.arange(_HASH_SIZE * _HASH_SIZE - 1, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+
+def _thumbnails(images: Sequence[Image.Image], width: int, height: int) -> np.ndarray:
+    """Stack grayscale thumbnails into one (n, height, width) float array"""
+    return np.stack([
+        np.asarray(image.convert("L").resize((width, height), Image.BILINEAR), dtype=np.float32)
+        for image in images
+    ])
+
+
+def _pack(bits: np.ndarray) -> List[int]:
+    """(n, 64) boolean array -> n Python ints"""
+    return [int(v) for v in (bits.reshape(len(bits), -1).astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1)]
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def ahash(images: Sequence[Image.Image]) -> List[int]:
+    pixels = _thumbnails(images, _HASH_SIZE, _HASH_SIZE)
+    return _pack(pixels > pixels.mean(axis=(1, 2), keepdims=True))
+
+
+def dhash(images: Sequence[Image.Image]) -> List[int]:
+    pixels = _thumbnails(images, _HASH_SIZE + 1, _HASH_SIZE)
+    return _pack(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash(images: Sequence[Image.Image]) -> List[int]:
+    pixels = _thumbnails(images, 32, 32)
+    # 2-D DCT of every thumbnail at once, keeping the low-frequency 8x8 corner
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:, :_HASH_SIZE, :_HASH_SIZE]
+    flat = low.reshape(len(low), -1)
+    median = np.median(flat[:, 1:], axis=1, keepdims=True)  # skip the DC term
+    return _pack(flat > median)
+
+
+HASH_FUNCTIONS: Dict[str, Callable[[Sequence[Image.Image]], List[int]]] = {
+    "ahash": ahash,
+    "dhash": dhash,
+    "phash": phash,
+}
+
+
+def hash_images(images: Sequence[Image.Image], method: str = DEDUP_HASH) -> List[int]:
+    if not images:
+        return []
+    try:
+        return HASH_FUNCTIONS[method](images)
+    except KeyError:
+        raise ValueError(f"Unknown perceptual hash: {method}") from None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def group_near_duplicates(hashes: Sequence[int], max_distance: int = DEDUP_MAX_DISTANCE) -> List[List[int]]:
+    """Group indices whose hashes are within max_distance of a group's first member.
+
+    Groups are compared against their representative (not any member) so that a
+    chain of small differences cannot merge unrelated items. Returns groups in
+    upload order; the first index of each group is its representative.
+    """
+    n = len(hashes)
+    if n == 0:
+        return []
+    if max_distance < 0:
+        return [[i] for i in range(n)]
+
+    values = np.array(hashes, dtype=np.uint64)
+    # Pairwise Hamming distances via XOR + bit unpacking, all in NumPy
+    xor = values[:, None] ^ values[None, :]
+    distances = np.unpackbits(xor.view(np.uint8).reshape(n, n, 8), axis=2).sum(axis=2)
+
+    group_of = [-1] * n
+    groups: List[List[int]] = []
+    for i in range(n):
+        if group_of[i] != -1:
+            continue
+        group_of[i] = len(groups)
+        members = [i]
+        for j in np.nonzero(distances[i, i + 1:] <= max_distance)[0] + i + 1:
+            if group_of[j] == -1:
+                group_of[j] = group_of[i]
+                members.append(int(j))
+        groups.append(members)
+    return groups
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for radius queries in Hamming space"""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # node: [hash, values, {distance: child}]
+        self._size = 0
+
+    def add(self, value_hash: int, value: Hashable) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value_hash, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value_hash, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, value_hash: int, radius: int) -> List[Tuple[int, Hashable]]:
+        """All (distance, value) pairs within radius, closest first"""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value_hash, node[0])
+            if d <= radius:
+                found.extend((d, v) for v in node[1])
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class NearDuplicateIndex:
+    """Process-wide index from perceptual hash to cache key of a previous classification.
+
+    Bounded: once full, the oldest half of the entries is dropped and the tree rebuilt.
+    """
+
+    def __init__(self, max_entries: int = DEDUP_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = deque()
+        self._trees: Dict[Hashable, BKTree] = {}
+        self._lock = threading.Lock()
+
+    def add(self, value_hash: int, key: Tuple[str, str, str]) -> None:
+        """key is a (digest, state, prompt version) cache key"""
+        with self._lock:
+            self._entries.append((value_hash, key))
+            if len(self._entries) > self.max_entries:
+                for _ in range(len(self._entries) - self.max_entries // 2):
+                    self._entries.popleft()
+                self._trees = {}
+                for h, k in self._entries:
+                    self._tree(k).add(h, k)
+            else:
+                self._tree(key).add(value_hash, key)
+
+    def _tree(self, key: Tuple[str, str, str]) -> BKTree:
+        # Only answers for the same state and prompt version are interchangeable
+        scope = key[1:]
+        tree = self._trees.get(scope)
+        if tree is None:
+            tree = self._trees[scope] = BKTree()
+        return tree
+
+    def nearest(self, value_hash: int, state: str, prompt_version: str,
+                max_distance: int = DEDUP_MAX_DISTANCE) -> List[Tuple[str, str, str]]:
+        """Cache keys of earlier images within max_distance, closest first"""
+        if max_distance < 0:
+            return []
+        with self._lock:
+            tree = self._trees.get((state, prompt_version))
+            if tree is None:
+                return []
+            return [key for _, key in tree.search(value_hash, max_distance)]
+
+
+near_duplicate_index = NearDuplicateIndex()
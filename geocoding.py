@@ -0,0 +1,318 @@
+"""Reverse geocoding with a grid-cell cache and an offline state resolver.
+
+Coordinates well inside exactly one state's bounding box, near a bundled city,
+are resolved locally, so the common case never waits on Nominatim. Bounding
+boxes of neighbouring states overlap, so anything near a border goes to the
+network with a timeout; answers are memoized per grid cell.
+"""
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from classification_cache import LRUCache
+from resources import http_get, http_session
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are snapped to cells of this size (~5 km) before caching
+GEOCODE_GRID_DEGREES = float(os.getenv("GEOCODE_GRID_DEGREES", "0.05"))
+GEOCODE_TIMEOUT_SECONDS = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "5"))
+# The offline city is only trusted when a bundled city is this close
+OFFLINE_CITY_RADIUS_KM = float(os.getenv("OFFLINE_CITY_RADIUS_KM", "40"))
+# Boxes are grown by this much before checking which contain a point, so the
+# offline answer is only trusted this far (~20 km) from any other state's box
+OFFLINE_BORDER_MARGIN_DEGREES = float(os.getenv("OFFLINE_BORDER_MARGIN_DEGREES", "0.2"))
+
+NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
+COUNTRY = "India"
+
+# (lat_min, lat_max, lon_min, lon_max) boxes for every state/UT in data/recycling_rules.json;
+# UTs made of separate pieces (Puducherry, Dadra and Nagar Haveli and Daman and Diu) have one box per piece
+STATE_BOUNDS: Dict[str, List[Tuple[float, float, float, float]]] = {
+    "Andhra Pradesh": [(12.6, 19.2, 76.7, 84.8)],
+    "Arunachal Pradesh": [(26.6, 29.5, 91.5, 97.5)],
+    "Assam": [(24.1, 28.0, 89.7, 96.1)],
+    "Bihar": [(24.3, 27.6, 83.3, 88.3)],
+    "Chhattisgarh": [(17.8, 24.1, 80.2, 84.4)],
+    "Goa": [(14.9, 15.8, 73.6, 74.4)],
+    "Gujarat": [(20.1, 24.7, 68.1, 74.5)],
+    "Haryana": [(27.6, 30.95, 74.4, 77.6)],
+    "Himachal Pradesh": [(30.4, 33.3, 75.5, 79.0)],
+    "Jharkhand": [(21.9, 25.4, 83.3, 87.95)],
+    "Karnataka": [(11.5, 18.5, 74.0, 78.6)],
+    "Kerala": [(8.2, 12.8, 74.8, 77.5)],
+    "Madhya Pradesh": [(21.0, 26.9, 74.0, 82.9)],
+    "Maharashtra": [(15.6, 22.1, 72.6, 80.9)],
+    "Manipur": [(23.8, 25.7, 92.9, 94.8)],
+    "Meghalaya": [(25.0, 26.1, 89.8, 92.8)],
+    "Mizoram": [(21.9, 24.6, 92.2, 93.5)],
+    "Nagaland": [(25.2, 27.05, 93.3, 95.3)],
+    "Odisha": [(17.8, 22.6, 81.3, 87.5)],
+    "Punjab": [(29.5, 32.6, 73.8, 77.0)],
+    "Rajasthan": [(23.0, 30.2, 69.5, 78.3)],
+    "Sikkim": [(27.0, 28.2, 88.0, 88.95)],
+    "Tamil Nadu": [(8.0, 13.6, 76.2, 80.4)],
+    "Telangana": [(15.8, 19.95, 77.2, 81.8)],
+    "Tripura": [(22.9, 24.6, 91.1, 92.4)],
+    "Uttar Pradesh": [(23.8, 30.4, 77.0, 84.7)],
+    "Uttarakhand": [(28.7, 31.5, 77.5, 81.1)],
+    "West Bengal": [(21.5, 27.3, 85.8, 89.9)],
+    "Andaman and Nicobar Islands": [(6.7, 13.7, 92.2, 94.0)],
+    "Chandigarh": [(30.65, 30.8, 76.68, 76.85)],
+    "Dadra and Nagar Haveli and Daman and Diu": [(20.0, 20.45, 72.75, 73.25), (20.68, 20.76, 70.85, 71.02)],
+    "Delhi": [(28.40, 28.89, 76.84, 77.35)],
+    "Jammu and Kashmir": [(32.2, 35.1, 73.2, 76.8)],
+    "Ladakh": [(32.3, 36.0, 75.3, 80.3)],
+    "Lakshadweep": [(8.2, 12.4, 71.6, 74.0)],
+    "Puducherry": [(11.75, 12.1, 79.6, 79.9), (10.8, 11.05, 79.7, 79.9), (11.68, 11.73, 75.5, 75.56),
+                   (16.69, 16.76, 82.18, 82.26)],
+}
+
+# (city, state, lat, lon)
+CITIES: List[Tuple[str, str, float, float]] = [
+    ("Mumbai", "Maharashtra", 19.0760, 72.8777),
+    ("Pune", "Maharashtra", 18.5204, 73.8567),
+    ("Nagpur", "Maharashtra", 21.1458, 79.0882),
+    ("Nashik", "Maharashtra", 19.9975, 73.7898),
+    ("Aurangabad", "Maharashtra", 19.8762, 75.3433),
+    ("Kolhapur", "Maharashtra", 16.7050, 74.2433),
+    ("Solapur", "Maharashtra", 17.6599, 75.9064),
+    ("Amravati", "Maharashtra", 20.9374, 77.7796),
+    ("New Delhi", "Delhi", 28.6139, 77.2090),
+    ("Delhi", "Delhi", 28.7041, 77.1025),
+    ("Bengaluru", "Karnataka", 12.9716, 77.5946),
+    ("Mysuru", "Karnataka", 12.2958, 76.6394),
+    ("Mangaluru", "Karnataka", 12.9141, 74.8560),
+    ("Hubballi", "Karnataka", 15.3647, 75.1240),
+    ("Belagavi", "Karnataka", 15.8497, 74.4977),
+    ("Kalaburagi", "Karnataka", 17.3297, 76.8343),
+    ("Chennai", "Tamil Nadu", 13.0827, 80.2707),
+    ("Coimbatore", "Tamil Nadu", 11.0168, 76.9558),
+    ("Madurai", "Tamil Nadu", 9.9252, 78.1198),
+    ("Tiruchirappalli", "Tamil Nadu", 10.7905, 78.7047),
+    ("Salem", "Tamil Nadu", 11.6643, 78.1460),
+    ("Tirunelveli", "Tamil Nadu", 8.7139, 77.7567),
+    ("Vellore", "Tamil Nadu", 12.9165, 79.1325),
+    ("Kolkata", "West Bengal", 22.5726, 88.3639),
+    ("Howrah", "West Bengal", 22.5958, 88.2636),
+    ("Durgapur", "West Bengal", 23.5204, 87.3119),
+    ("Asansol", "West Bengal", 23.6739, 86.9524),
+    ("Siliguri", "West Bengal", 26.7271, 88.3953),
+    ("Kharagpur", "West Bengal", 22.3460, 87.2320),
+    ("Ahmedabad", "Gujarat", 23.0225, 72.5714),
+    ("Gandhinagar", "Gujarat", 23.2156, 72.6369),
+    ("Surat", "Gujarat", 21.1702, 72.8311),
+    ("Vadodara", "Gujarat", 22.3072, 73.1812),
+    ("Rajkot", "Gujarat", 22.3039, 70.8022),
+    ("Bhavnagar", "Gujarat", 21.7645, 72.1519),
+    ("Jamnagar", "Gujarat", 22.4707, 70.0577),
+    ("Bhuj", "Gujarat", 23.2420, 69.6669),
+    ("Jaipur", "Rajasthan", 26.9124, 75.7873),
+    ("Jodhpur", "Rajasthan", 26.2389, 73.0243),
+    ("Udaipur", "Rajasthan", 24.5854, 73.7125),
+    ("Kota", "Rajasthan", 25.2138, 75.8648),
+    ("Bikaner", "Rajasthan", 28.0229, 73.3119),
+    ("Ajmer", "Rajasthan", 26.4499, 74.6399),
+    ("Jaisalmer", "Rajasthan", 26.9157, 70.9083),
+    ("Visakhapatnam", "Andhra Pradesh", 17.6868, 83.2185),
+    ("Vijayawada", "Andhra Pradesh", 16.5062, 80.6480),
+    ("Guntur", "Andhra Pradesh", 16.3067, 80.4365),
+    ("Tirupati", "Andhra Pradesh", 13.6288, 79.4192),
+    ("Nellore", "Andhra Pradesh", 14.4426, 79.9865),
+    ("Kurnool", "Andhra Pradesh", 15.8281, 78.0373),
+    ("Kakinada", "Andhra Pradesh", 16.9891, 82.2475),
+    ("Anantapur", "Andhra Pradesh", 14.6819, 77.6006),
+    ("Hyderabad", "Telangana", 17.3850, 78.4867),
+    ("Warangal", "Telangana", 17.9689, 79.5941),
+    ("Nizamabad", "Telangana", 18.6725, 78.0940),
+    ("Karimnagar", "Telangana", 18.4386, 79.1288),
+    ("Khammam", "Telangana", 17.2473, 80.1514),
+    ("Mahbubnagar", "Telangana", 16.7488, 77.9856),
+    ("Adilabad", "Telangana", 19.6641, 78.5320),
+    ("Lucknow", "Uttar Pradesh", 26.8467, 80.9462),
+    ("Kanpur", "Uttar Pradesh", 26.4499, 80.3319),
+    ("Agra", "Uttar Pradesh", 27.1767, 78.0081),
+    ("Varanasi", "Uttar Pradesh", 25.3176, 82.9739),
+    ("Prayagraj", "Uttar Pradesh", 25.4358, 81.8463),
+    ("Ghaziabad", "Uttar Pradesh", 28.6692, 77.4538),
+    ("Noida", "Uttar Pradesh", 28.5355, 77.3910),
+    ("Meerut", "Uttar Pradesh", 28.9845, 77.7064),
+    ("Gorakhpur", "Uttar Pradesh", 26.7606, 83.3732),
+    ("Bareilly", "Uttar Pradesh", 28.3670, 79.4304),
+    ("Jhansi", "Uttar Pradesh", 25.4484, 78.5685),
+    ("Itanagar", "Arunachal Pradesh", 27.0844, 93.6053),
+    ("Guwahati", "Assam", 26.1445, 91.7362),
+    ("Patna", "Bihar", 25.5941, 85.1376),
+    ("Raipur", "Chhattisgarh", 21.2514, 81.6296),
+    ("Panaji", "Goa", 15.4909, 73.8278),
+    ("Gurugram", "Haryana", 28.4595, 77.0266),
+    ("Shimla", "Himachal Pradesh", 31.1048, 77.1734),
+    ("Ranchi", "Jharkhand", 23.3441, 85.3096),
+    ("Thiruvananthapuram", "Kerala", 8.5241, 76.9366),
+    ("Kochi", "Kerala", 9.9312, 76.2673),
+    ("Bhopal", "Madhya Pradesh", 23.2599, 77.4126),
+    ("Indore", "Madhya Pradesh", 22.7196, 75.8577),
+    ("Imphal", "Manipur", 24.8170, 93.9368),
+    ("Shillong", "Meghalaya", 25.5788, 91.8933),
+    ("Aizawl", "Mizoram", 23.7271, 92.7176),
+    ("Kohima", "Nagaland", 25.6751, 94.1086),
+    ("Bhubaneswar", "Odisha", 20.2961, 85.8245),
+    ("Ludhiana", "Punjab", 30.9010, 75.8573),
+    ("Amritsar", "Punjab", 31.6340, 74.8723),
+    ("Gangtok", "Sikkim", 27.3389, 88.6065),
+    ("Agartala", "Tripura", 23.8315, 91.2868),
+    ("Dehradun", "Uttarakhand", 30.3165, 78.0322),
+    ("Port Blair", "Andaman and Nicobar Islands", 11.6234, 92.7265),
+    ("Chandigarh", "Chandigarh", 30.7333, 76.7794),
+    ("Daman", "Dadra and Nagar Haveli and Daman and Diu", 20.3974, 72.8328),
+    ("Srinagar", "Jammu and Kashmir", 34.0837, 74.7973),
+    ("Jammu", "Jammu and Kashmir", 32.7266, 74.8570),
+    ("Leh", "Ladakh", 34.1526, 77.5771),
+    ("Kavaratti", "Lakshadweep", 10.5667, 72.6417),
+    ("Puducherry", "Puducherry", 11.9416, 79.8083),
+]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+@dataclass
+class OfflineMatch:
+    state: str
+    city: Optional[str]
+    distance_km: float
+
+
+class OfflineStateResolver:
+    """Maps coordinates to a bundled state without any network access.
+
+    Bounding boxes are only a coarse outline, so a point is resolved only when
+    exactly one box, grown by margin degrees, contains it; a point in two boxes
+    is near a border and left to the network. A 1-degree grid index maps each
+    cell to the states whose grown box touches it, so a lookup only checks a
+    handful of boxes and cities.
+    """
+
+    def __init__(self, bounds: Dict[str, List[Tuple[float, float, float, float]]] = STATE_BOUNDS,
+                 cities: List[Tuple[str, str, float, float]] = CITIES,
+                 margin: float = OFFLINE_BORDER_MARGIN_DEGREES):
+        # (state, grown box) pairs, indexed by the grid cells each box touches
+        self._cells: Dict[Tuple[int, int], List[Tuple[str, Tuple[float, float, float, float]]]] = {}
+        for state, boxes in bounds.items():
+            for lat_min, lat_max, lon_min, lon_max in boxes:
+                box = (lat_min - margin, lat_max + margin, lon_min - margin, lon_max + margin)
+                for i in range(math.floor(box[0]), math.floor(box[1]) + 1):
+                    for j in range(math.floor(box[2]), math.floor(box[3]) + 1):
+                        self._cells.setdefault((i, j), []).append((state, box))
+        self._cities_by_state: Dict[str, List[Tuple[str, float, float]]] = {}
+        for city, state, lat, lon in cities:
+            self._cities_by_state.setdefault(state, []).append((city, lat, lon))
+
+    def candidates(self, lat: float, lon: float) -> List[str]:
+        states = []
+        for state, (lat_min, lat_max, lon_min, lon_max) in self._cells.get((math.floor(lat), math.floor(lon)), []):
+            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max and state not in states:
+                states.append(state)
+        return states
+
+    def resolve(self, lat: float, lon: float) -> Optional[OfflineMatch]:
+        """State (and nearby city, if any) for the coordinates, or None unless exactly one state fits"""
+        candidates = self.candidates(lat, lon)
+        if len(candidates) != 1:
+            return None
+        state = candidates[0]
+        best = None
+        for city, city_lat, city_lon in self._cities_by_state.get(state, []):
+            d = haversine_km(lat, lon, city_lat, city_lon)
+            if best is None or d < best[1]:
+                best = (city, d)
+        if best is None:
+            return OfflineMatch(state=state, city=None, distance_km=math.inf)
+        city, distance = best
+        return OfflineMatch(state=state, city=city if distance <= OFFLINE_CITY_RADIUS_KM else None,
+                            distance_km=distance)
+
+
+def grid_cell(lat: float, lon: float, grid: float = GEOCODE_GRID_DEGREES) -> Tuple[int, int]:
+    return (round(lat / grid), round(lon / grid))
+
+
+offline_resolver = OfflineStateResolver()
+# Reverse geocoding answers by grid cell, shared by all sessions in the process
+geocode_cache = LRUCache(max_entries=4096, ttl=7 * 24 * 3600, name="geocode")
+_ip_location_cache = LRUCache(max_entries=1, ttl=3600, name="ip_location")
+
+
+def reverse_geocode_online(lat: float, lon: float, timeout: float = GEOCODE_TIMEOUT_SECONDS) -> Optional[Dict[str, str]]:
+    response = http_get(
+        NOMINATIM_REVERSE_URL,
+        params={"lat": lat, "lon": lon, "format": "json"},
+        timeout=timeout,
+    )
+    if response.status_code != 200:
+        return None
+    address = response.json().get("address", {})
+    state = address.get("state")
+    if not state:
+        return None
+    return {
+        "city": address.get("city", address.get("town", address.get("village"))),
+        "state": state,
+        "country": address.get("country", COUNTRY),
+    }
+
+
+def reverse_geocode(lat: float, lon: float) -> Optional[Dict[str, str]]:
+    """{"city", "state", "country"} for the coordinates, or None if nothing is known.
+
+    "city" may be None when neither a nearby bundled city nor Nominatim names one.
+    """
+    with metrics.span("geolocation"):
+        cell = grid_cell(lat, lon)
+        cached = geocode_cache.get(cell)
+        if cached is not None:
+            metrics.inc("ecogenie_geocode_requests_total", source="cache")
+            return cached
+
+        match = offline_resolver.resolve(lat, lon)
+        if match is not None and match.city is not None:
+            metrics.inc("ecogenie_geocode_requests_total", source="offline")
+            location = {"city": match.city, "state": match.state, "country": COUNTRY}
+            geocode_cache.put(cell, location)
+            return location
+
+        metrics.inc("ecogenie_geocode_requests_total", source="network")
+        try:
+            location = reverse_geocode_online(lat, lon)
+        except (OSError, ValueError) as e:  # network errors, or a reply that is not JSON
+            logger.warning("Reverse geocoding failed for cell %s: %s", cell, e)
+            location = None
+        if location is not None:
+            geocode_cache.put(cell, location)
+        elif match is not None:
+            # Not cached: the network may answer with the city next time
+            location = {"city": None, "state": match.state, "country": COUNTRY}
+        return location
+
+
+def ip_location(timeout: float = GEOCODE_TIMEOUT_SECONDS) -> Optional[Dict[str, str]]:
+    """IP-based location, looked up at most once an hour per process"""
+    cached = _ip_location_cache.get("me")
+    if cached is not None:
+        return cached
+    import geocoder
+
+    metrics.inc("ecogenie_geocode_requests_total", source="ip")
+    with metrics.span("geolocation"):
+        g = geocoder.ip("me", timeout=timeout, session=http_session())
+    if not g.ok:
+        return None
+    location = {"city": g.city, "state": g.state, "country": g.country}
+    _ip_location_cache.put("me", location)
+    return location
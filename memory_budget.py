@@ -0,0 +1,128 @@
+"""Memory budget for the uploads that sessions hold while they are classified.
+
+Every kept image is charged for what it pins in memory (its encoded payload and
+display thumbnail) against its session's allowance and against the process-wide
+budget shared by all sessions. The prepared images in preprocess.prepared_cache
+count against the process budget too; an image that is both cached and held by a
+session is counted twice, which overstates use by at most the cache's size.
+
+When the process is over budget the session gets its own copy of the image with
+the payload spilled to a temporary file (read back when it is sent); the cached
+original, which other sessions may share, is left as it is. When a session is
+over its own allowance, further images are shed (skipped, with a message) so one
+large upload cannot crowd out everyone else. Charges are returned when the
+session ends.
+
+    with memory_budget.session() as allowance:
+        images = [kept for kept in map(allowance.admit, prepared) if kept is not None]
+"""
+import contextlib
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import metrics
+from classification_cache import LRUCache
+from preprocess import PreparedImage, prepared_cache
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+# 0 disables a limit
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "512"))
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "64"))
+# Where spilled payloads go (default: the system temporary directory)
+MEMORY_SPILL_DIR = os.getenv("MEMORY_SPILL_DIR") or None
+
+
+class SessionAllowance:
+    """One session's share of the budget; see MemoryBudget.session"""
+
+    def __init__(self, budget: "MemoryBudget"):
+        self.budget = budget
+        self.used = 0
+        self.shed = 0
+
+    def admit(self, image: PreparedImage) -> Optional[PreparedImage]:
+        """Charge image to this session; returns it, a spilled copy if the process is short, or None to shed it"""
+        cost = image.memory_bytes
+        if self.budget.session_limit and self.used + cost > self.budget.session_limit:
+            self.shed += 1
+            self.budget.record("shed")
+            return None
+        if not self.budget.charge(cost):
+            image = image.spilled(self.budget.spill_dir)
+            cost = image.memory_bytes
+            self.budget.record("spill")
+            if not self.budget.charge(cost):
+                self.shed += 1
+                self.budget.record("shed")
+                return None
+        self.used += cost
+        return image
+
+    def release(self) -> None:
+        self.budget.credit(self.used)
+        self.used = 0
+
+
+class MemoryBudget:
+    """Process-wide accounting of bytes held by active sessions and the prepared-image cache"""
+
+    def __init__(self, limit_mb: float = MEMORY_BUDGET_MB, session_limit_mb: float = SESSION_MEMORY_BUDGET_MB,
+                 spill_dir: Optional[str] = MEMORY_SPILL_DIR, cache: Optional[LRUCache] = prepared_cache):
+        self.cache = cache
+        self.limit = int(limit_mb * _MB)
+        self.session_limit = int(session_limit_mb * _MB)
+        self.spill_dir = spill_dir
+        self.used = 0
+        self.peak = 0
+        self.events: Dict[str, int] = {"spill": 0, "shed": 0}
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @property
+    def cached(self) -> int:
+        return self.cache.weight if self.cache is not None else 0
+
+    def charge(self, amount: int) -> bool:
+        cached = self.cached
+        with self._lock:
+            if self.limit and self.used + cached + amount > self.limit:
+                return False
+            self.used += amount
+            self.peak = max(self.peak, self.used + cached)
+            return True
+
+    def credit(self, amount: int) -> None:
+        with self._lock:
+            self.used -= amount
+
+    def record(self, action: str) -> None:
+        with self._lock:
+            self.events[action] += 1
+        metrics.inc("ecogenie_memory_budget_events_total", action=action)
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[SessionAllowance]:
+        allowance = SessionAllowance(self)
+        try:
+            yield allowance
+        finally:
+            allowance.release()
+            if allowance.shed:
+                logger.warning("Shed %d images to stay within the memory budget", allowance.shed)
+
+    def stats(self) -> Dict[str, Any]:
+        cached = self.cached
+        with self._lock:
+            return {"used_mb": round(self.used / _MB, 2), "cached_mb": round(cached / _MB, 2),
+                    "peak_mb": round(self.peak / _MB, 2),
+                    "limit_mb": round(self.limit / _MB, 2), "session_limit_mb": round(self.session_limit / _MB, 2),
+                    **self.events}
+
+
+memory_budget = MemoryBudget()
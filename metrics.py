@@ -0,0 +1,207 @@
+"""Lightweight timing spans and counters, exported in Prometheus text format.
+
+Off by default. Set METRICS_PORT to serve /metrics from a background thread,
+and/or METRICS_FILE to rewrite a file every METRICS_FILE_INTERVAL seconds (for
+node_exporter's textfile collector). When neither is set, span() hands back a
+shared no-op context manager and inc()/observe() return immediately.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+SPAN_METRIC = "ecogenie_span_seconds"
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    SPAN_METRIC: "Time spent in instrumented code paths",
+    "ecogenie_cache_requests_total": "In-memory cache lookups by cache and result",
+    "ecogenie_result_store_requests_total": "On-disk result store lookups by result",
+    "ecogenie_model_requests_total": "Model requests by kind (single, batch) and outcome",
+    "ecogenie_model_tokens_total": "Tokens reported by the model's usage metadata, by prompt version and direction",
+    "ecogenie_retries_total": "Model requests repeated after a failure, by reason",
+    "ecogenie_payload_bytes_total": "Image bytes as uploaded (original) and after preprocessing (prepared)",
+    "ecogenie_images_total": "Images classified, by how the answer was obtained",
+    "ecogenie_geocode_requests_total": "Location lookups by source",
+    "ecogenie_preclassifier_requests_total": "Local pre-classifier lookups by result",
+    "ecogenie_api_requests_total": "HTTP API requests by endpoint and status code",
+    "ecogenie_page_runs_total": "Streamlit script runs of the upload page, by prompt version",
+    "ecogenie_memory_budget_events_total": "Uploads spilled to disk or shed to stay within the memory budget",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, list]] = {}  # [bucket counts..., sum, count]
+
+    def inc(self, name: str, value: float = 1.0, labels: LabelKey = ()) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: LabelKey = ()) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, state in sorted(self._histograms[name].items()):
+                    for bound, count in zip(BUCKETS, state):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+registry = Registry()
+_enabled = False
+_NOOP = contextlib.nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    if _enabled:
+        registry.inc(name, value, _label_key(labels))
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if _enabled:
+        registry.observe(name, value, _label_key(labels))
+
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(SPAN_METRIC, time.perf_counter() - self.started, (("span", self.name),))
+        return False
+
+
+def span(name: str):
+    """Time a block: `with span("model_call"): ...`"""
+    return _Span(name) if _enabled else _NOOP
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        # Usually another worker on this host already serves METRICS_PORT; its numbers cover only that worker
+        logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_file(path: str) -> None:
+    """Atomically replace path with the current metrics"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(registry.render())
+    os.replace(tmp, path)
+
+
+def _file_writer(path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            write_file(path)
+        except OSError as e:
+            logger.warning("Could not write metrics file %s: %s", path, e)
+
+
+def enable(port: int = 0, path: str = "") -> None:
+    """Turn collection on and start the requested exporters"""
+    global _enabled
+    _enabled = True
+    if port:
+        start_http_server(port)
+    if path:
+        threading.Thread(target=_file_writer, args=(path, METRICS_FILE_INTERVAL),
+                         name="metrics-file", daemon=True).start()
+
+
+# Imported modules live for the whole process, so exporters start once per worker
+if METRICS_PORT or METRICS_FILE:
+    enable(METRICS_PORT, METRICS_FILE)
@@ -0,0 +1,232 @@
+"""Model backends behind classify_scrap.
+
+Both backends expose the small part of genai.GenerativeModel that the app uses,
+generate_content(contents, stream=..., generation_config=...), so the
+classification code does not care which one it talks to.
+
+MODEL_BACKEND=fake selects FakeBackend, a deterministic local stand-in with
+configurable latency and error rate for offline tests and load benchmarks.
+"""
+import abc
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
+
+
+def model_identity(name: Optional[str] = None) -> str:
+    """Which model answers for backend name (default MODEL_BACKEND), e.g. "gemini:gemini-1.5-flash".
+
+    Part of every prompt version, so answers from one model are never served as another's.
+    """
+    name = (name or MODEL_BACKEND).lower()
+    return f"gemini:{GEMINI_MODEL_NAME}" if name == "gemini" else name
+
+
+class ModelBackend(abc.ABC):
+    """Interface: what classify_scrap needs from a model"""
+    name = "base"
+
+    @abc.abstractmethod
+    def generate_content(self, contents: List[Any], stream: bool = False,
+                         generation_config: Optional[Dict[str, Any]] = None):
+        """A response with .text and .usage_metadata; iterable in chunks when stream is True"""
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini; the SDK is configured on first use, not at import"""
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME, api_key: Optional[str] = None):
+        self.model_name = model_name
+        self._api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    api_key = self._api_key or os.getenv("API_KEY")
+                    if not api_key:
+                        raise ValueError("API_KEY not found. Please set it in the .env file or as an environment variable.")
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate_content(self, contents, stream=False, generation_config=None):
+        return self._client().generate_content(contents, stream=stream, generation_config=generation_config)
+
+
+# Canned answers, matching scrap_record.RESPONSE_SCHEMA
+CANNED_ANSWERS: List[Dict[str, Any]] = [
+    {"item": "PET water bottle", "material": "plastic", "recyclable": True,
+     "recyclability_notes": "PET (#1) is accepted by most dry-waste collectors.",
+     "value_min_inr": 1, "value_max_inr": 3,
+     "preparation_steps": ["Empty and rinse the bottle", "Remove the cap and label", "Crush it flat"],
+     "safety": ["No special precautions needed"], "hazardous": False,
+     "environmental_impact": "Recycled PET replaces virgin plastic and keeps bottles out of drains."},
+    {"item": "Cardboard box", "material": "paper", "recyclable": True,
+     "recyclability_notes": "Clean, dry cardboard is widely recycled.",
+     "value_min_inr": 5, "value_max_inr": 15,
+     "preparation_steps": ["Remove tape and staples", "Flatten the box", "Keep it dry"],
+     "safety": ["Watch for staples and sharp edges"], "hazardous": False,
+     "environmental_impact": "Recycling cardboard saves trees and landfill space."},
+    {"item": "Aluminium can", "material": "metal", "recyclable": True,
+     "recyclability_notes": "Aluminium can be recycled indefinitely.",
+     "value_min_inr": 2, "value_max_inr": 4,
+     "preparation_steps": ["Rinse out residue", "Crush the can"],
+     "safety": ["Torn edges can be sharp"], "hazardous": False,
+     "environmental_impact": "Recycled aluminium needs about 5% of the energy of new metal."},
+    {"item": "Old mobile phone", "material": "e-waste", "recyclable": True,
+     "recyclability_notes": "Must go to an authorised e-waste collector.",
+     "value_min_inr": 100, "value_max_inr": 800,
+     "preparation_steps": ["Back up and wipe your data", "Remove the SIM and memory cards", "Keep the battery in place"],
+     "safety": ["Do not puncture or heat the battery", "Store away from water"], "hazardous": True,
+     "environmental_impact": "Phones contain recoverable metals and toxic materials that must not reach landfills."},
+    {"item": "Glass bottle", "material": "glass", "recyclable": True,
+     "recyclability_notes": "Intact glass bottles are bought back by kabadiwalas.",
+     "value_min_inr": 1, "value_max_inr": 2,
+     "preparation_steps": ["Rinse the bottle", "Remove the cap"],
+     "safety": ["Wrap broken glass before handing it over"], "hazardous": False,
+     "environmental_impact": "Glass recycles without loss of quality."},
+]
+
+
+@dataclass
+class FakeUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+
+    @property
+    def total_token_count(self) -> int:
+        return self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    """Looks like a GenerateContentResponse: .text, .usage_metadata, and iterable chunks when streamed"""
+
+    def __init__(self, text: str, usage: FakeUsage, chunks: Sequence[str] = (), chunk_delay: float = 0.0):
+        self.text = text
+        self.usage_metadata = usage
+        self._chunks = list(chunks) or [text]
+        self._chunk_delay = chunk_delay
+
+    def __iter__(self) -> Iterator["FakeResponse"]:
+        for i, chunk in enumerate(self._chunks):
+            if i and self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            last = i == len(self._chunks) - 1
+            yield FakeResponse(chunk, self.usage_metadata if last else FakeUsage(0, 0))
+
+
+class FakeModelError(Exception):
+    """Simulated transient failure (like a 429 from the real API)"""
+    # rate_limit.is_transient retries errors by their HTTP status code
+    code = 429
+
+
+class FakeBackend(ModelBackend):
+    """Deterministic offline model.
+
+    The answer for an image depends only on the image bytes. Latency follows the
+    configured distribution ("constant:s", "uniform:lo:hi" or "lognormal:median:sigma",
+    in seconds) and error_rate is the chance a call raises FakeModelError. Both are
+    drawn from a seeded RNG so runs are repeatable.
+    """
+    name = "fake"
+
+    def __init__(self, latency: str = "constant:0", error_rate: float = 0.0, seed: int = 0,
+                 answers: Optional[List[Dict[str, Any]]] = None, stream_chunks: int = 4):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.answers = answers or CANNED_ANSWERS
+        self.stream_chunks = max(1, stream_chunks)
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeBackend":
+        answers = None
+        path = os.getenv("FAKE_ANSWERS")
+        if path:
+            with open(path, encoding="utf-8") as fh:
+                answers = json.load(fh)
+        return cls(latency=os.getenv("FAKE_LATENCY", "constant:0"),
+                   error_rate=float(os.getenv("FAKE_ERROR_RATE", "0")),
+                   seed=int(os.getenv("FAKE_SEED", "0")),
+                   answers=answers)
+
+    def _draw(self):
+        kind, *params = self.latency.split(":")
+        values = [float(p) for p in params]
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+            if kind == "constant":
+                delay = values[0] if values else 0.0
+            elif kind == "uniform":
+                delay = self._rng.uniform(values[0], values[1])
+            elif kind == "lognormal":
+                delay = values[0] * self._rng.lognormvariate(0.0, values[1])
+            else:
+                raise ValueError(f"Unknown latency distribution: {self.latency}")
+        return delay, fail
+
+    def _answer_for(self, part: Any) -> Dict[str, Any]:
+        if isinstance(part, dict):
+            data = part.get("data", b"")
+        elif hasattr(part, "tobytes"):
+            data = part.tobytes()
+        else:
+            data = str(part).encode()
+        digest = hashlib.sha256(data).digest()
+        return self.answers[int.from_bytes(digest[:4], "big") % len(self.answers)]
+
+    def generate_content(self, contents, stream=False, generation_config=None):
+        delay, fail = self._draw()
+        images = [part for part in contents if not isinstance(part, str)]
+        prompt_chars = sum(len(part) for part in contents if isinstance(part, str))
+        # Stream: spend part of the latency before the first chunk, the rest between chunks
+        first_delay = delay / 2 if stream else delay
+        time.sleep(first_delay)
+        if fail:
+            raise FakeModelError("429 Resource has been exhausted (simulated)")
+
+        schema = (generation_config or {}).get("response_schema") or {}
+        if schema.get("type") == "array":
+            answer: Any = [dict(self._answer_for(part), image_number=i) for i, part in enumerate(images, start=1)]
+        else:
+            answer = self._answer_for(images[0]) if images else self.answers[0]
+        text = json.dumps(answer, ensure_ascii=False)
+        # Like the real API, an answer longer than max_output_tokens is cut off
+        cap = (generation_config or {}).get("max_output_tokens")
+        if cap and len(text) // 4 > cap:
+            text = text[:cap * 4]
+        usage = FakeUsage(prompt_token_count=prompt_chars // 4 + 258 * len(images),
+                          candidates_token_count=len(text) // 4)
+        if not stream:
+            return FakeResponse(text, usage)
+        size = -(-len(text) // self.stream_chunks)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        return FakeResponse(text, usage, chunks, chunk_delay=(delay - first_delay) / max(1, len(chunks) - 1))
+
+
+def build_backend(name: Optional[str] = None) -> ModelBackend:
+    """A new backend for name (default MODEL_BACKEND); resources.model_client() holds the shared one"""
+    name = (name or MODEL_BACKEND).lower()
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "fake":
+        return FakeBackend.from_env()
+    raise ValueError(f"Unknown MODEL_BACKEND: {name}")
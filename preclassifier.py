@@ -0,0 +1,280 @@
+"""CPU-only nearest-neighbour stage that answers common items without a model call.
+
+Each image is reduced to a small feature vector (an HSV colour histogram plus a
+coarse grayscale layout) and compared by cosine similarity against images whose
+classification the model already confirmed. When enough close neighbours agree
+on the item, their record is reused; otherwise the image falls through to the
+model, whose answer is then added to the index. Records carry state-specific
+recyclability notes, so neighbours are only looked up within the same state and
+prompt version.
+
+Off by default (PRECLASSIFIER=on). The index lives in memory and can be seeded
+from classify_cli output:
+
+    python preclassifier.py build results.jsonl --output .ecogenie/preclassifier.npz
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import metrics
+from scrap_record import ScrapRecord
+
+logger = logging.getLogger(__name__)
+
+PRECLASSIFIER = os.getenv("PRECLASSIFIER", "off").lower() in ("1", "on", "true", "yes")
+PRECLASSIFIER_INDEX = os.getenv("PRECLASSIFIER_INDEX", os.path.join(".ecogenie", "preclassifier.npz"))
+# Cosine similarity a neighbour needs to count as the same kind of item
+PRECLASSIFIER_MIN_SIMILARITY = float(os.getenv("PRECLASSIFIER_MIN_SIMILARITY", "0.97"))
+# How many confirmed neighbours must agree (and none may disagree) before the model is skipped
+PRECLASSIFIER_MIN_VOTES = int(os.getenv("PRECLASSIFIER_MIN_VOTES", "2"))
+PRECLASSIFIER_K = int(os.getenv("PRECLASSIFIER_K", "5"))
+PRECLASSIFIER_MAX_ENTRIES = int(os.getenv("PRECLASSIFIER_MAX_ENTRIES", "5000"))
+
+_HUE_BINS, _SAT_BINS, _VAL_BINS = 12, 4, 4
+_LAYOUT = 8
+
+
+def features(image: Image.Image) -> np.ndarray:
+    """Unit-length vector: HSV histogram (192 bins) followed by an 8x8 mean-centred layout"""
+    small = image.convert("RGB").resize((64, 64), Image.BILINEAR)
+    hsv = np.asarray(small.convert("HSV"), dtype=np.uint16).reshape(-1, 3)
+    bins = ((hsv[:, 0] * _HUE_BINS >> 8) * _SAT_BINS + (hsv[:, 1] * _SAT_BINS >> 8)) * _VAL_BINS \
+        + (hsv[:, 2] * _VAL_BINS >> 8)
+    histogram = np.bincount(bins, minlength=_HUE_BINS * _SAT_BINS * _VAL_BINS).astype(np.float32)
+    histogram /= np.linalg.norm(histogram) or 1.0
+    layout = np.asarray(small.convert("L").resize((_LAYOUT, _LAYOUT), Image.BILINEAR), dtype=np.float32).ravel()
+    layout -= layout.mean()
+    layout /= np.linalg.norm(layout) or 1.0
+    vector = np.concatenate([histogram, 0.5 * layout])
+    return vector / np.linalg.norm(vector)
+
+
+def _label(record: ScrapRecord) -> Tuple[str, str]:
+    return (record.item.strip().lower(), record.material.strip().lower())
+
+
+@dataclass
+class LocalMatch:
+    record: ScrapRecord
+    similarity: float
+    votes: int
+
+
+class Preclassifier:
+    """Bounded in-memory nearest-neighbour index over confirmed classifications, per (state, prompt version)"""
+
+    def __init__(self, min_similarity: float = PRECLASSIFIER_MIN_SIMILARITY, min_votes: int = PRECLASSIFIER_MIN_VOTES,
+                 k: int = PRECLASSIFIER_K, max_entries: int = PRECLASSIFIER_MAX_ENTRIES):
+        self.min_similarity = min_similarity
+        self.min_votes = min_votes
+        self.k = k
+        self.max_entries = max_entries
+        # Keyed by (state, prompt_version)
+        self._vectors: Dict[Tuple[str, str], List[np.ndarray]] = {}
+        self._records: Dict[Tuple[str, str], List[ScrapRecord]] = {}
+        self._matrices: Dict[Tuple[str, str], np.ndarray] = {}  # stacked _vectors, rebuilt after adds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._records.values())
+
+    def add(self, image: Image.Image, record: ScrapRecord, state: str, prompt_version: str) -> None:
+        self.add_vector(features(image), record, state, prompt_version)
+
+    def add_vector(self, vector: np.ndarray, record: ScrapRecord, state: str, prompt_version: str) -> None:
+        scope = (state, prompt_version)
+        with self._lock:
+            vectors = self._vectors.setdefault(scope, [])
+            records = self._records.setdefault(scope, [])
+            vectors.append(vector.astype(np.float32))
+            records.append(record)
+            if len(records) > self.max_entries:
+                # Drop the oldest half, like the near-duplicate index
+                drop = len(records) - self.max_entries // 2
+                del vectors[:drop], records[:drop]
+            self._matrices.pop(scope, None)
+
+    def _snapshot(self, scope: Tuple[str, str]) -> Tuple[Optional[np.ndarray], List[ScrapRecord]]:
+        with self._lock:
+            records = list(self._records.get(scope, []))
+            if not records:
+                return None, records
+            matrix = self._matrices.get(scope)
+            if matrix is None:
+                matrix = self._matrices[scope] = np.stack(self._vectors[scope])
+            return matrix, records
+
+    def classify(self, image: Image.Image, state: str, prompt_version: str) -> Optional[LocalMatch]:
+        """A confident match among confirmed answers for this state, or None to fall through to the model"""
+        started = time.perf_counter()
+        with metrics.span("preclassify"):
+            match = self._match(features(image), (state, prompt_version))
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.seconds += elapsed
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc("ecogenie_preclassifier_requests_total", result="miss" if match is None else "hit")
+        return match
+
+    def _match(self, vector: np.ndarray, scope: Tuple[str, str]) -> Optional[LocalMatch]:
+        matrix, records = self._snapshot(scope)
+        if matrix is None or len(records) < self.min_votes:
+            return None
+        return self._vote(matrix @ vector, records)
+
+    def _vote(self, similarities: np.ndarray, records: List[ScrapRecord]) -> Optional[LocalMatch]:
+        nearest = np.argsort(similarities)[::-1][:self.k]
+        close = [i for i in nearest if similarities[i] >= self.min_similarity]
+        if len(close) < self.min_votes:
+            return None
+        labels = {_label(records[i]) for i in close}
+        if len(labels) != 1:
+            return None
+        best = close[0]
+        return LocalMatch(record=records[best], similarity=float(similarities[best]), votes=len(close))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self),
+                "lookups": lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "mean_ms": round(self.seconds / lookups * 1000, 3) if lookups else 0.0,
+            }
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            scopes = sorted(scope for scope, records in self._records.items() if records)
+            arrays = {f"vectors_{i}": np.stack(self._vectors[scope]) for i, scope in enumerate(scopes)}
+            meta = [{"state": state, "prompt_version": version,
+                     "records": [r.to_dict() for r in self._records[(state, version)]]}
+                    for state, version in scopes]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> int:
+        """Add the entries saved at path; returns how many were loaded"""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            loaded = 0
+            for i, scope in enumerate(meta):
+                if "state" not in scope:
+                    # Saved before entries were kept per state; the notes may be for any state
+                    continue
+                for vector, record in zip(data[f"vectors_{i}"], scope["records"]):
+                    self.add_vector(vector, ScrapRecord.from_dict(record), scope["state"], scope["prompt_version"])
+                    loaded += 1
+        return loaded
+
+
+_preclassifier: Optional[Preclassifier] = None
+_preclassifier_lock = threading.Lock()
+
+
+def get_preclassifier() -> Optional[Preclassifier]:
+    """Process-wide preclassifier (seeded from PRECLASSIFIER_INDEX if it exists), or None when disabled"""
+    global _preclassifier
+    if not PRECLASSIFIER:
+        return None
+    if _preclassifier is None:
+        with _preclassifier_lock:
+            if _preclassifier is None:
+                index = Preclassifier()
+                if os.path.exists(PRECLASSIFIER_INDEX):
+                    try:
+                        logger.info("Loaded %d preclassifier entries from %s",
+                                    index.load(PRECLASSIFIER_INDEX), PRECLASSIFIER_INDEX)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning("Could not load preclassifier index %s: %s", PRECLASSIFIER_INDEX, e)
+                _preclassifier = index
+    return _preclassifier
+
+
+def _build(args) -> int:
+    from preprocess import preprocess_image
+    from rules_store import rules_store
+
+    index = Preclassifier()
+    added = skipped = 0
+    for source in args.results:
+        with open(source, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                # Only answers the model gave for this very image count as confirmed
+                if row.get("error") or not row.get("record") or row.get("duplicate_of") or row.get("matched_locally"):
+                    continue
+                try:
+                    with open(row["path"], "rb") as image_file:
+                        prepared = preprocess_image(image_file.read())
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping %s: %s", row["path"], e)
+                    skipped += 1
+                    continue
+                state = rules_store.canonical_state(row["state"]) or row["state"]
+                index.add(prepared.preview(), ScrapRecord.from_dict(row["record"]), state, row["prompt_version"])
+                added += 1
+    index.save(args.output)
+    print(f"Indexed {added} confirmed classifications ({skipped} unreadable) into {args.output}")
+    return 0
+
+
+def _evaluate(args) -> int:
+    """Leave-one-out: how often the stage would answer, and how often it agrees with the model"""
+    index = Preclassifier()
+    index.load(args.index)
+    total = answered = agreed = 0
+    for scope in list(index._records):
+        matrix, records = index._snapshot(scope)
+        if matrix is None:
+            continue
+        similarities = matrix @ matrix.T
+        for i in range(len(records)):
+            row = similarities[i].copy()
+            row[i] = -np.inf  # leave the image itself out
+            match = index._vote(row, records)
+            total += 1
+            if match is not None:
+                answered += 1
+                agreed += _label(match.record) == _label(records[i])
+    print(json.dumps({"entries": total, "hit_rate": round(answered / total, 3) if total else 0.0,
+                      "precision": round(agreed / answered, 3) if answered else None}, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build and evaluate the local preclassifier index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Index the confirmed answers in classify_cli JSONL output")
+    build.add_argument("results", nargs="+", help="classify_cli output files")
+    build.add_argument("--output", default=PRECLASSIFIER_INDEX, help="Index file (default: %(default)s)")
+    evaluate = commands.add_parser("evaluate", help="Leave-one-out hit rate and precision of an index")
+    evaluate.add_argument("--index", default=PRECLASSIFIER_INDEX, help="Index file (default: %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    return _build(args) if args.command == "build" else _evaluate(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,197 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+import metrics
+from classification_cache import LRUCache, image_digest
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1024"))
+PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "JPEG").upper()
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "80"))
+# Longest edge of the JPEG thumbnail kept for display
+THUMBNAIL_EDGE = int(os.getenv("THUMBNAIL_EDGE", "384"))
+# Prepared uploads kept across Streamlit reruns, keyed by upload content
+PREPARED_CACHE_ENTRIES = int(os.getenv("PREPARED_CACHE_ENTRIES", "64"))
+# Full-resolution decodes running at once across all sessions; each can take tens of MB
+PREPROCESS_MAX_CONCURRENT = int(os.getenv("PREPROCESS_MAX_CONCURRENT", str(min(4, os.cpu_count() or 1))))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+_decode_slots = threading.BoundedSemaphore(max(1, PREPROCESS_MAX_CONCURRENT))
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@dataclass(eq=False)
+class PreparedImage:
+    """A downscaled, re-encoded, metadata-free image ready to send to the model.
+
+    No decoded pixels are kept: only the encoded payload (which can be spilled to
+    disk), a small display thumbnail and the pixel digest used in cache keys.
+    """
+    payload: Optional[bytes]  # None once spilled to spill_path
+    mime_type: str
+    original_bytes: int
+    encoded_bytes: int
+    size: Tuple[int, int]
+    digest: str
+    thumbnail: bytes
+    spill_path: Optional[str] = None
+
+    @property
+    def data(self) -> bytes:
+        if self.payload is not None:
+            return self.payload
+        with open(self.spill_path, "rb") as fh:
+            return fh.read()
+
+    @property
+    def image(self) -> Image.Image:
+        """Full prepared pixels, decoded on every access"""
+        return Image.open(io.BytesIO(self.data))
+
+    def preview(self) -> Image.Image:
+        """The decoded thumbnail; enough for perceptual hashes and colour features"""
+        return Image.open(io.BytesIO(self.thumbnail))
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.encoded_bytes
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.thumbnail) + (len(self.payload) if self.payload is not None else 0)
+
+    def spilled(self, directory: Optional[str] = None) -> "PreparedImage":
+        """A copy whose payload lives in a temporary file (removed with the copy).
+
+        This object is left alone: it may sit in prepared_cache and be shared by
+        other sessions.
+        """
+        if self.payload is None:
+            return self
+        fd, path = tempfile.mkstemp(prefix="ecogenie-", suffix=".img", dir=directory)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(self.payload)
+        copy = replace(self, payload=None, spill_path=path)
+        weakref.finalize(copy, _remove, path)
+        return copy
+
+
+ImageInput = Union[Image.Image, PreparedImage]
+
+
+def _read_bytes(source: Union[bytes, BinaryIO]) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    if hasattr(source, "getvalue"):  # Streamlit's UploadedFile and io.BytesIO
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Drop alpha onto a white background, since JPEG has no transparency"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def preprocess_image(source: Union[bytes, BinaryIO], max_edge: int = PREPROCESS_MAX_EDGE,
+                     fmt: str = PREPROCESS_FORMAT, quality: int = PREPROCESS_QUALITY) -> PreparedImage:
+    """Orient by EXIF, downscale to max_edge, and re-encode without metadata"""
+    fmt = fmt.upper()
+    if fmt not in _MIME_TYPES:
+        raise ValueError(f"Unsupported preprocessing format: {fmt}")
+
+    raw = _read_bytes(source)
+    # Only the compact results outlive this block, so bounding it bounds peak decode memory
+    with _decode_slots:
+        with metrics.span("decode"):
+            image = Image.open(io.BytesIO(raw))
+            if image.format == "JPEG":
+                # Let libjpeg decode at a reduced scale (1/2, 1/4, 1/8) instead of full resolution
+                image.draft("RGB", (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            image = _flatten(image)
+
+        # No exif/icc arguments are passed to save(), so metadata is not carried over
+        with metrics.span("encode"):
+            out = io.BytesIO()
+            if fmt == "JPEG":
+                image.save(out, format="JPEG", quality=quality, optimize=True)
+            else:
+                image.save(out, format="WEBP", quality=quality, method=4)
+            data = out.getvalue()
+        metrics.inc("ecogenie_payload_bytes_total", len(raw), kind="original")
+        metrics.inc("ecogenie_payload_bytes_total", len(data), kind="prepared")
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE), Image.BILINEAR)
+        out = io.BytesIO()
+        thumbnail.save(out, format="JPEG", quality=75)
+        prepared = PreparedImage(payload=data, mime_type=_MIME_TYPES[fmt], original_bytes=len(raw),
+                                 encoded_bytes=len(data), size=image.size, digest=image_digest(image),
+                                 thumbnail=out.getvalue())
+    logger.info("Preprocessed image %dx%d: %d -> %d bytes (%d saved)", *prepared.size,
+                prepared.original_bytes, prepared.encoded_bytes, prepared.bytes_saved)
+    return prepared
+
+
+# Shared by all sessions; memory_budget counts its weight against the process budget
+prepared_cache = LRUCache(max_entries=PREPARED_CACHE_ENTRIES, ttl=None, name="prepared",
+                          weigh=lambda prepared: prepared.memory_bytes)
+
+
+def preprocess_cached(source: Union[bytes, BinaryIO]) -> PreparedImage:
+    """preprocess_image, reusing the result for an upload seen before (e.g. on a Streamlit rerun)"""
+    raw = _read_bytes(source)
+    key = hashlib.sha256(raw).hexdigest()
+    prepared = prepared_cache.get(key)
+    if prepared is None:
+        prepared = preprocess_image(raw)
+        prepared_cache.put(key, prepared)
+    return prepared
+
+
+def preview(item: ImageInput) -> Image.Image:
+    """A small version of item for perceptual hashing and features, without decoding the full payload"""
+    return item.preview() if isinstance(item, PreparedImage) else item
+
+
+def content_digest(item: ImageInput) -> str:
+    return item.digest if isinstance(item, PreparedImage) else image_digest(item)
+
+
+def model_part(item: ImageInput):
+    """What to hand to generate_content: the compact encoded bytes when we have them"""
+    if isinstance(item, PreparedImage):
+        return {"mime_type": item.mime_type, "data": item.data}
+    return item
+
+
+def format_bytes(n: int) -> str:
+    sign = "-" if n < 0 else ""
+    n = abs(n)
+    for unit in ("B", "KB", "MB"):
+        if n < 1024 or unit == "MB":
+            return f"{sign}{n:.0f} {unit}" if unit == "B" else f"{sign}{n:.1f} {unit}"
+        n /= 1024
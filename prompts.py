@@ -0,0 +1,159 @@
+"""Versioned prompt templates, output-token caps and per-call token accounting.
+
+Every template is dedented and fingerprinted once at import. Its version is the
+label plus a hash of the text, the batch instructions, both response schemas and
+the model that answers (MODEL_BACKEND and GEMINI_MODEL_NAME), e.g. "app-v2+1a2b3c4d".
+That version is part of every cache, result-store and pre-classifier key. Editing
+a prompt or switching models therefore stops old answers from being reused, even
+if nobody bumps the label; canned FakeBackend answers never reach a real run.
+
+Each front end ("app", "waste_info") has a "full" prompt. Both share one
+"compact" prompt: a few lines that rely on the response schema for the field
+list and ask for short answers under a smaller output cap. It is for cost- or
+latency-sensitive paths. PROMPT_VARIANT picks the default variant.
+
+    template = get_prompt("app", "compact")
+    contents = [template.render("Karnataka"), image_part]
+    config = template.generation_config(images=1)
+
+"python prompts.py" lists the current versions, e.g. for
+"python result_store.py compact --keep-prompt-version ...".
+"""
+import hashlib
+import json
+import os
+import textwrap
+import threading
+from typing import Any, Dict, Optional
+
+import metrics
+from batching import BATCH_INSTRUCTIONS
+from model_backend import model_identity
+from rate_limit import ANSWER_TOKENS
+from scrap_record import BATCH_GENERATION_CONFIG, BATCH_RESPONSE_SCHEMA, GENERATION_CONFIG, RESPONSE_SCHEMA
+
+# "full" or "compact"
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "full")
+# Output tokens allowed per image (batched requests get this times the number of images); 0: the model's limit
+MODEL_MAX_OUTPUT_TOKENS = int(os.getenv("MODEL_MAX_OUTPUT_TOKENS", "1024"))
+COMPACT_MAX_OUTPUT_TOKENS = int(os.getenv("COMPACT_MAX_OUTPUT_TOKENS", "384"))
+
+
+class PromptTemplate:
+    """Classification instructions with a {state} placeholder, formatted once per state"""
+
+    def __init__(self, label: str, template: str, max_output_tokens: int = MODEL_MAX_OUTPUT_TOKENS):
+        self.label = label
+        self.template = textwrap.dedent(template).strip()
+        self.max_output_tokens = max_output_tokens
+        # Everything that shapes the answer: what the model is asked, single or batched, and which model
+        fingerprint = hashlib.sha256("\0".join([
+            model_identity(), self.template, BATCH_INSTRUCTIONS, json.dumps(RESPONSE_SCHEMA, sort_keys=True),
+            json.dumps(BATCH_RESPONSE_SCHEMA, sort_keys=True),
+        ]).encode("utf-8")).hexdigest()[:8]
+        self.version = f"{label}+{fingerprint}"
+        self._rendered: Dict[str, str] = {}
+        self._configs: Dict[int, Dict[str, Any]] = {}
+
+    def render(self, state: str) -> str:
+        prompt = self._rendered.get(state)
+        if prompt is None:
+            prompt = self._rendered[state] = self.template.format(state=state)
+        return prompt
+
+    def generation_config(self, images: int = 1) -> Dict[str, Any]:
+        """Response schema and output cap for a request covering this many images"""
+        config = self._configs.get(images)
+        if config is None:
+            config = dict(GENERATION_CONFIG if images == 1 else BATCH_GENERATION_CONFIG)
+            if self.max_output_tokens:
+                config["max_output_tokens"] = self.max_output_tokens * images
+            self._configs[images] = config
+        return config
+
+    @property
+    def answer_tokens(self) -> int:
+        """Expected output tokens per image, for quota estimates"""
+        return min(ANSWER_TOKENS, self.max_output_tokens) if self.max_output_tokens else ANSWER_TOKENS
+
+
+APP_PROMPT = PromptTemplate("app-v2", """
+This image shows an item the user wishes to sell to a local scrap collector in {state}, India. Based on the object in the image, provide a detailed classification by filling in every field of the JSON response:
+
+1. **item** and **material**: What the object is and its main material category (plastic, paper, metal, glass, e-waste, ...).
+2. **recyclable** and **recyclability_notes**: Clearly state if this item is recyclable based on {state} recycling guidelines, and why.
+3. **value_min_inr** and **value_max_inr**: A rough range of its resale value to a scrap collector, as numbers in ₹. Use null if it has no resale value.
+4. **preparation_steps**: Clear and specific steps to prepare the item for resale or recycling (e.g., cleaning, drying, disassembling).
+5. **safety** and **hazardous**: Actionable safety tips for handling or storing the item; hazardous is true for batteries, chemicals, sharp or toxic items.
+6. **environmental_impact**: Explain briefly why recycling this item is important for the environment.
+
+If a field is not applicable, use an empty list or null, or say "Not applicable."
+""")
+
+WASTE_INFO_PROMPT = PromptTemplate("waste-info-v2", """
+        This image shows an item the user wishes to sell to a local scrap collector in {state}, India. Based on the object in the image, please fill in every field of the JSON response:
+
+        1. item, material: What the object is and its main material category (plastic, paper, metal, glass, e-waste, ...).
+        2. recyclable, recyclability_notes: Whether this item is recyclable according to {state} recycling guidelines.
+        3. value_min_inr, value_max_inr: If the item can be sold to a scrap collector, its potential resale value range as numbers in ₹ (null otherwise).
+        4. preparation_steps: Specific steps for preparing this item (cleaning, drying, segregating) to maximize resale value.
+        5. safety, hazardous: Practical advice on safe handling and storage, considering {state} regulations; hazardous is true for batteries, chemicals, sharp or toxic items.
+        6. environmental_impact: Brief note on environmental benefits of recycling this item.
+        """)
+
+COMPACT_PROMPT = PromptTemplate("compact-v1", """
+Classify the item in this image for a scrap collector in {state}, India. Fill every JSON field briefly: one short sentence for recyclability_notes and environmental_impact, at most three preparation_steps and safety tips. recyclable follows {state} guidelines; value_min_inr and value_max_inr are the resale range in ₹ (null if none); hazardous is true for batteries, chemicals, sharp or toxic items.
+""", max_output_tokens=COMPACT_MAX_OUTPUT_TOKENS)
+
+# Full prompts by front end
+PROMPTS = {"app": APP_PROMPT, "waste_info": WASTE_INFO_PROMPT}
+VARIANTS = {"full": PROMPTS, "compact": {name: COMPACT_PROMPT for name in PROMPTS}}
+
+
+def get_prompt(name: str = "app", variant: Optional[str] = None) -> PromptTemplate:
+    """The template for a front end ("app" or "waste_info") and variant (default PROMPT_VARIANT)"""
+    variant = variant or PROMPT_VARIANT
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown prompt variant {variant!r}; expected one of {sorted(VARIANTS)}")
+    return VARIANTS[variant][name]
+
+
+class TokenLedger:
+    """Input and output tokens per prompt version, added up from each call's usage_metadata"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, int]] = {}
+
+    def record(self, version: str, usage: Any) -> None:
+        if usage is None:
+            return
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        with self._lock:
+            totals = self._totals.setdefault(version, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+        metrics.inc("ecogenie_model_tokens_total", input_tokens, prompt=version, direction="input")
+        metrics.inc("ecogenie_model_tokens_total", output_tokens, prompt=version, direction="output")
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Totals and per-call averages by prompt version"""
+        with self._lock:
+            snapshot = {version: dict(totals) for version, totals in self._totals.items()}
+        for totals in snapshot.values():
+            calls = max(1, totals["calls"])
+            totals["input_per_call"] = round(totals["input_tokens"] / calls, 1)
+            totals["output_per_call"] = round(totals["output_tokens"] / calls, 1)
+        return snapshot
+
+
+# Shared by every engine in the process
+token_ledger = TokenLedger()
+
+
+if __name__ == "__main__":
+    for variant, templates in VARIANTS.items():
+        for name, template in templates.items():
+            print(f"{name}\t{variant}\t{template.version}\tmax_output_tokens={template.max_output_tokens}")
@@ -0,0 +1,193 @@
+"""Quota-aware model calls: token-bucket rate limiting, retries, and single-flight.
+
+Everything here is process-wide (Streamlit keeps imported modules alive across
+reruns), so all sessions in one worker share the same quota. With several
+workers on one API key, divide MODEL_RPM / MODEL_TPM between them.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Defaults match the free tier of gemini-1.5-flash; 0 turns a limit off
+MODEL_RPM = float(os.getenv("MODEL_RPM", "15"))
+MODEL_TPM = float(os.getenv("MODEL_TPM", "1000000"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_RETRY_BASE_SECONDS = float(os.getenv("MODEL_RETRY_BASE_SECONDS", "1"))
+MODEL_RETRY_MAX_SECONDS = float(os.getenv("MODEL_RETRY_MAX_SECONDS", "30"))
+# Give up instead of queueing a request behind more than this much quota wait
+MODEL_QUOTA_WAIT_SECONDS = float(os.getenv("MODEL_QUOTA_WAIT_SECONDS", "60"))
+
+# Gemini bills every image as a fixed number of tokens; answers are a few hundred
+IMAGE_TOKENS = 258
+ANSWER_TOKENS = 400
+
+# google.api_core exception names for errors worth retrying (matched by name so
+# this module does not import the SDK)
+_TRANSIENT_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                     "DeadlineExceeded", "GatewayTimeout", "BadGateway"}
+_TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class QuotaExceeded(Exception):
+    """The model stayed rate limited (or busy) after waiting and retrying"""
+
+
+class TokenBucket:
+    """Refills at rate units per second up to capacity; acquire() blocks until enough is available"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Take amount now (possibly going negative) and return how long to wait for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def wait_time(self, amount: float) -> float:
+        with self._lock:
+            tokens = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            return max(0.0, (amount - tokens) / self.rate)
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until amount is available; returns the seconds spent waiting"""
+        # Reserving up front keeps callers first-come first-served instead of racing on refill
+        delay = self._reserve(min(amount, self.capacity))
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def refund(self, amount: float) -> None:
+        """Give back (or, with a negative amount, charge extra) after the real cost is known"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute quota, as the Gemini API enforces it"""
+
+    def __init__(self, rpm: float = MODEL_RPM, tpm: float = MODEL_TPM,
+                 max_wait: float = MODEL_QUOTA_WAIT_SECONDS):
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm)) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm / 60.0, tpm) if tpm > 0 else None
+        self.max_wait = max_wait
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Wait for one request slot and estimated_tokens of token quota"""
+        buckets = [(b, n) for b, n in ((self.requests, 1), (self.tokens, estimated_tokens)) if b is not None]
+        expected = max((b.wait_time(n) for b, n in buckets), default=0.0)
+        if expected > self.max_wait:
+            raise QuotaExceeded(f"Model quota exhausted; the next slot is {expected:.0f}s away. Please try again later.")
+        return sum(b.acquire(n) for b, n in buckets)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token bucket once the response reports its real usage"""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+
+def estimate_tokens(contents: List[Any], answer_tokens: int = ANSWER_TOKENS) -> int:
+    text = sum(len(part) for part in contents if isinstance(part, str))
+    images = sum(1 for part in contents if not isinstance(part, str))
+    return text // 4 + IMAGE_TOKENS * images + answer_tokens * max(1, images)
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_ERRORS:
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in _TRANSIENT_CODES
+
+
+def backoff_delay(attempt: int, base: float = MODEL_RETRY_BASE_SECONDS, cap: float = MODEL_RETRY_MAX_SECONDS) -> float:
+    """Full-jitter exponential backoff for the given retry number (1, 2, ...)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def retry_call(func: Callable[[], T], max_retries: int = MODEL_MAX_RETRIES,
+               on_retry: Optional[Callable[[BaseException, int], None]] = None) -> T:
+    """Call func, retrying transient errors with jittered exponential backoff"""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            attempt += 1
+            if attempt > max_retries:
+                raise QuotaExceeded(f"The model is busy or rate limited ({e}); gave up after "
+                                    f"{max_retries} retries. Please try again later.") from e
+            delay = backoff_delay(attempt)
+            logger.info("Transient model error (%s), retry %d/%d in %.1fs", e, attempt, max_retries, delay)
+            if on_retry is not None:
+                on_retry(e, attempt)
+            time.sleep(delay)
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller (the leader) runs func; callers arriving while it is in
+    flight wait and get the leader's result or exception.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = func()
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+model_limiter = RateLimiter()
+model_flight = SingleFlight()
@@ -0,0 +1,316 @@
+"""Totals for a batch of classifications, and exports that are written row by row.
+
+BatchSummary is updated as each result arrives (estimated value range, counts by
+material, hazardous items), so totals are available while a batch is still
+running. The writers emit one row per result and keep nothing but the running
+totals, so exporting thousands of items costs the same memory as exporting ten.
+
+    python report.py results.jsonl --output totals.xlsx    # from classify_cli output
+    python report.py results.jsonl --output totals.csv
+
+XLSX needs the optional openpyxl package (write-only mode, also streamed).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from scrap_record import ScrapRecord
+
+COLUMNS = ["name", "item", "material", "recyclable", "hazardous", "value_min_inr", "value_max_inr",
+           "recyclability_notes", "preparation_steps", "safety", "environmental_impact", "duplicate_of",
+           "matched_locally", "error"]
+FORMATS = ("csv", "json", "jsonl", "xlsx")
+
+
+@dataclass
+class MaterialTotals:
+    items: int = 0
+    recyclable: int = 0
+    hazardous: int = 0
+    value_min_inr: float = 0.0
+    value_max_inr: float = 0.0
+
+
+@dataclass
+class BatchSummary:
+    """Running totals over classification results; near-duplicate photos only add to duplicates"""
+    items: int = 0
+    classified: int = 0
+    errors: int = 0
+    duplicates: int = 0
+    recyclable: int = 0
+    valued: int = 0  # items with a resale value
+    value_min_inr: float = 0.0
+    value_max_inr: float = 0.0
+    by_material: Dict[str, MaterialTotals] = field(default_factory=dict)
+    hazardous: List[Tuple[str, str]] = field(default_factory=list)  # (name, item)
+
+    def add(self, result: Dict[str, Any], name: str = "") -> None:
+        """Count one result dict from ClassificationEngine.classify_stream"""
+        if result.get("duplicate_of") is not None:
+            # Another photo of an item already counted
+            self.duplicates += 1
+            return
+        self.items += 1
+        record: Optional[ScrapRecord] = result.get("record")
+        if record is None:
+            self.errors += 1
+            return
+        self.classified += 1
+        low, high = _value_bounds(record)
+        totals = self.by_material.setdefault(record.material, MaterialTotals())
+        totals.items += 1
+        if record.recyclable:
+            self.recyclable += 1
+            totals.recyclable += 1
+        if low is not None:
+            self.valued += 1
+            self.value_min_inr += low
+            self.value_max_inr += high
+            totals.value_min_inr += low
+            totals.value_max_inr += high
+        if record.hazardous:
+            totals.hazardous += 1
+            self.hazardous.append((name, record.item))
+
+    @property
+    def value_range(self) -> str:
+        if not self.valued:
+            return "No resale value"
+        low, high = self.value_min_inr, self.value_max_inr
+        return f"₹{low:,.0f}" if low == high else f"₹{low:,.0f} – ₹{high:,.0f}"
+
+    def material_rows(self) -> List[Dict[str, Any]]:
+        """One row per material, most items first"""
+        ordered = sorted(self.by_material.items(), key=lambda kv: (-kv[1].items, kv[0]))
+        return [dict(material=material, **asdict(totals)) for material, totals in ordered]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items, "classified": self.classified, "errors": self.errors,
+            "duplicates": self.duplicates, "recyclable": self.recyclable, "valued": self.valued,
+            "value_min_inr": self.value_min_inr, "value_max_inr": self.value_max_inr,
+            "by_material": self.material_rows(),
+            "hazardous": [{"name": name, "item": item} for name, item in self.hazardous],
+        }
+
+
+def _value_bounds(record: ScrapRecord) -> Tuple[Optional[float], Optional[float]]:
+    low, high = record.value_min_inr, record.value_max_inr
+    if low is None and high is None:
+        return None, None
+    return (low if low is not None else high), (high if high is not None else low)
+
+
+def result_row(result: Dict[str, Any], name: str = "") -> Dict[str, Any]:
+    """Flat export row for one result"""
+    record: Optional[ScrapRecord] = result.get("record")
+    row = dict.fromkeys(COLUMNS, "")
+    row.update(name=name, duplicate_of=result.get("duplicate_of"), matched_locally=bool(result.get("matched_locally")),
+               error=result.get("error") or "")
+    if record is not None:
+        low, high = _value_bounds(record)
+        row.update(item=record.item, material=record.material, recyclable=record.recyclable,
+                   hazardous=record.hazardous, value_min_inr=low, value_max_inr=high,
+                   recyclability_notes=record.recyclability_notes,
+                   preparation_steps="; ".join(record.preparation_steps), safety="; ".join(record.safety),
+                   environmental_impact=record.environmental_impact)
+    return row
+
+
+class ReportWriter:
+    """Writes each result as it is added and the totals on close"""
+
+    def __init__(self):
+        self.summary = BatchSummary()
+
+    def add(self, result: Dict[str, Any], name: str = "") -> None:
+        self.summary.add(result, name)
+        self.write_row(result_row(result, name))
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class CsvReportWriter(ReportWriter):
+    """Item rows only; totals are in self.summary (CSV has no second sheet)"""
+
+    def __init__(self, out: IO[str]):
+        super().__init__()
+        self._writer = csv.DictWriter(out, fieldnames=COLUMNS)
+        self._writer.writeheader()
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        self._writer.writerow({k: "" if v is None else v for k, v in row.items()})
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """One JSON object per item, then a final {"summary": ...} line"""
+
+    def __init__(self, out: IO[str]):
+        super().__init__()
+        self.out = out
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        self.out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self.out.write(json.dumps({"summary": self.summary.to_dict()}, ensure_ascii=False) + "\n")
+
+
+class JsonReportWriter(ReportWriter):
+    """{"items": [...], "summary": {...}}, with the items array written as they come"""
+
+    def __init__(self, out: IO[str]):
+        super().__init__()
+        self.out = out
+        self._first = True
+        out.write('{"items": [')
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        self.out.write(("\n" if self._first else ",\n") + json.dumps(row, ensure_ascii=False))
+        self._first = False
+
+    def close(self) -> None:
+        self.out.write('\n], "summary": ' + json.dumps(self.summary.to_dict(), ensure_ascii=False) + "}\n")
+
+
+class XlsxReportWriter(ReportWriter):
+    """Items sheet streamed through openpyxl's write-only mode, then Totals and Hazardous sheets"""
+
+    def __init__(self, out: IO[bytes]):
+        super().__init__()
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("XLSX export needs openpyxl (pip install openpyxl); use CSV or JSON instead") from None
+        self.out = out
+        self._workbook = Workbook(write_only=True)
+        self._items = self._workbook.create_sheet("Items")
+        self._items.append(COLUMNS)
+
+    def write_row(self, row: Dict[str, Any]) -> None:
+        self._items.append([row[column] for column in COLUMNS])
+
+    def close(self) -> None:
+        summary = self.summary
+        totals = self._workbook.create_sheet("Totals")
+        for label, value in (("Items", summary.items), ("Classified", summary.classified),
+                             ("Errors", summary.errors), ("Duplicates", summary.duplicates),
+                             ("Recyclable", summary.recyclable),
+                             ("Hazardous", len(summary.hazardous)), ("Estimated value min (INR)", summary.value_min_inr),
+                             ("Estimated value max (INR)", summary.value_max_inr)):
+            totals.append([label, value])
+        totals.append([])
+        columns = ["material", "items", "recyclable", "hazardous", "value_min_inr", "value_max_inr"]
+        totals.append(columns)
+        for row in summary.material_rows():
+            totals.append([row[column] for column in columns])
+        hazardous = self._workbook.create_sheet("Hazardous")
+        hazardous.append(["name", "item"])
+        for name, item in summary.hazardous:
+            hazardous.append([name, item])
+        self._workbook.save(self.out)
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def open_report_writer(fmt: str, out: IO) -> ReportWriter:
+    """Writer for fmt ("csv", "json", "jsonl" or "xlsx"); xlsx needs a binary stream, the rest text"""
+    writers = {"csv": CsvReportWriter, "json": JsonReportWriter, "jsonl": JsonLinesReportWriter,
+               "xlsx": XlsxReportWriter}
+    if fmt not in writers:
+        raise ValueError(f"Unknown report format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    return writers[fmt](out)
+
+
+def export_bytes(fmt: str, results: List[Tuple[str, Dict[str, Any]]]) -> bytes:
+    """A whole export in memory, for download buttons on small batches"""
+    if fmt == "xlsx":
+        out = io.BytesIO()
+        with open_report_writer(fmt, out) as writer:
+            for name, result in results:
+                writer.add(result, name)
+        return out.getvalue()
+    text = io.StringIO(newline="")
+    with open_report_writer(fmt, text) as writer:
+        for name, result in results:
+            writer.add(result, name)
+    return text.getvalue().encode("utf-8")
+
+
+def _cli_row_key(row: Dict[str, Any]) -> str:
+    return row.get("path") or row.get("digest") or ""
+
+
+def read_cli_results(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(path, result) for the last row of each image in classify_cli output, one line at a time.
+
+    A resumed run appends retried images to the same file, so a first pass finds
+    the line holding each image's latest row and the second yields only those.
+    """
+    latest: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as fh:
+        for number, line in enumerate(fh):
+            try:
+                latest[_cli_row_key(json.loads(line))] = number
+            except ValueError:
+                continue
+    keep = set(latest.values())
+    with open(path, encoding="utf-8") as fh:
+        for number, line in enumerate(fh):
+            if number not in keep:
+                continue
+            row = json.loads(line)
+            record = ScrapRecord.from_dict(row["record"]) if row.get("record") else None
+            yield row.get("path", ""), {"record": record, "error": row.get("error"),
+                                        "duplicate_of": row.get("duplicate_of"),
+                                        "matched_locally": row.get("matched_locally", False)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Totals and an export for classify_cli results")
+    parser.add_argument("results", nargs="+", help="classify_cli JSONL output files")
+    parser.add_argument("--output", required=True, help="Export file; the format follows the extension")
+    parser.add_argument("--format", choices=FORMATS, help="Override the format picked from --output")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        parser.error(f"cannot tell the format from {args.output!r}; pass --format")
+    if fmt == "xlsx" and not xlsx_available():
+        parser.error("XLSX export needs openpyxl (pip install openpyxl); use CSV or JSON instead")
+    binary = fmt == "xlsx"
+    with open(args.output, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8", "newline": ""})) as out:
+        with open_report_writer(fmt, out) as writer:
+            for source in args.results:
+                for name, result in read_cli_results(source):
+                    writer.add(result, name)
+    json.dump(writer.summary.to_dict(), sys.stdout, indent=2, ensure_ascii=False)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
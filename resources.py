@@ -0,0 +1,64 @@
+"""Process-wide shared clients: one pooled HTTP session and one model backend.
+
+Streamlit re-executes the app script on every rerun, but imported modules stay in
+sys.modules, so resources registered here are built once per process and reused
+by every session and rerun (the same lifetime st.cache_resource gives, without
+tying the CLI and benchmarks to a Streamlit runtime). The module-level caches,
+limiters and stores elsewhere (classification_cache, model_limiter, rules_store,
+memory_budget, ...) are process-wide for the same reason.
+"""
+import os
+import threading
+from typing import Any, Callable, Dict
+
+from model_backend import ModelBackend, build_backend
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+USER_AGENT = "EcoGenie/1.0"
+
+_registry: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_resource(name: str, factory: Callable[[], Any]) -> Any:
+    """The shared instance registered under name, built by factory on first use"""
+    resource = _registry.get(name)
+    if resource is None:
+        with _lock:
+            resource = _registry.get(name)
+            if resource is None:
+                resource = _registry[name] = factory()
+    return resource
+
+
+def _build_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # Idempotent GETs only; connection errors and 5xx from a CDN or Nominatim are worth one more try
+    retry = Retry(total=HTTP_RETRIES, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def http_session():
+    """Keep-alive requests.Session shared by the whole process"""
+    return get_resource("http_session", _build_session)
+
+
+def http_get(url: str, timeout: float = HTTP_TIMEOUT_SECONDS, **kwargs):
+    """GET through the pooled session, always with a timeout"""
+    return http_session().get(url, timeout=timeout, **kwargs)
+
+
+def model_client() -> ModelBackend:
+    """The model backend selected by MODEL_BACKEND, shared by both front ends"""
+    return get_resource("model_client", build_backend)
@@ -0,0 +1,216 @@
+"""SQLite-backed store for classification results.
+
+Survives process restarts and is shared by every Streamlit worker on the host.
+Run `python result_store.py compact --help` for the eviction command.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]  # (image digest, state, prompt version)
+
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", os.path.join(".ecogenie", "results.sqlite3"))
+
+# SQLite caps the number of host parameters per statement; stay well below it
+_LOOKUP_CHUNK = 300
+# last_used is only rewritten once it is this stale, so most reads take no write lock;
+# eviction works in days, so an hour of slack does not change what gets dropped
+_LAST_USED_RESOLUTION_SECONDS = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT NOT NULL,
+    state TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, state, prompt_version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+class ResultStore:
+    """Embedded store for the {"record", "recycling_rules"} dicts built by ClassificationEngine"""
+
+    def __init__(self, path: str = RESULT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        # With isolation_level=None, "with conn" does not open a transaction, so do it explicitly
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, dict]:
+        """Look up a whole upload batch at once; missing keys are left out of the result.
+
+        The store is only a cache, so database errors are logged and treated as misses.
+        """
+        keys = list(dict.fromkeys(keys))
+        try:
+            found = self._get_many(keys)
+        except sqlite3.Error as e:
+            logger.warning("Result store lookup failed: %s", e)
+            found = {}
+        metrics.inc("ecogenie_result_store_requests_total", len(found), result="hit")
+        metrics.inc("ecogenie_result_store_requests_total", len(keys) - len(found), result="miss")
+        return found
+
+    def _get_many(self, keys: list) -> Dict[Key, dict]:
+        found: Dict[Key, dict] = {}
+        if not keys:
+            return found
+        conn = self._conn()
+        now = time.time()
+        stale = []
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join(["(?, ?, ?)"] * len(chunk))
+            params = [part for key in chunk for part in key]
+            rows = conn.execute(
+                f"SELECT digest, state, prompt_version, payload, last_used FROM results "
+                f"WHERE (digest, state, prompt_version) IN (VALUES {placeholders})",
+                params,
+            ).fetchall()
+            for digest, state, prompt_version, payload, last_used in rows:
+                found[(digest, state, prompt_version)] = json.loads(payload)
+                if now - last_used >= _LAST_USED_RESOLUTION_SECONDS:
+                    stale.append((now, digest, state, prompt_version))
+        if stale:
+            with self._transaction(conn):
+                conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE digest = ? AND state = ? AND prompt_version = ?", stale,
+                )
+        return found
+
+    def get(self, key: Key) -> Optional[dict]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, records: Dict[Key, dict]) -> None:
+        if not records:
+            return
+        now = time.time()
+        rows = [(*key, json.dumps(record, ensure_ascii=False), now, now) for key, record in records.items()]
+        try:
+            conn = self._conn()
+            with self._transaction(conn):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO results (digest, state, prompt_version, payload, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as e:
+            logger.warning("Result store write failed: %s", e)
+
+    def put(self, key: Key, record: dict) -> None:
+        self.put_many({key: record})
+
+    def compact(self, max_entries: Optional[int] = None, max_age_days: Optional[float] = None,
+                keep_prompt_versions: Optional[Iterable[str]] = None) -> int:
+        """Evict old or surplus rows (least recently used first), then reclaim disk space.
+
+        Returns the number of rows removed.
+        """
+        conn = self._conn()
+        removed = 0
+        with self._transaction(conn):
+            if keep_prompt_versions:
+                versions = list(keep_prompt_versions)
+                placeholders = ",".join("?" * len(versions))
+                removed += conn.execute(
+                    f"DELETE FROM results WHERE prompt_version NOT IN ({placeholders})", versions
+                ).rowcount
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                removed += conn.execute("DELETE FROM results WHERE last_used < ?", (cutoff,)).rowcount
+            if max_entries is not None:
+                removed += conn.execute(
+                    "DELETE FROM results WHERE (digest, state, prompt_version) IN ("
+                    "SELECT digest, state, prompt_version FROM results "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                ).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return removed
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> Optional[ResultStore]:
+    """Process-wide store, or None when RESULT_STORE_PATH is set to "off" or cannot be opened"""
+    global _store
+    if RESULT_STORE_PATH.lower() in ("", "off", "none"):
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = ResultStore(RESULT_STORE_PATH)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Result store disabled, could not open %s: %s", RESULT_STORE_PATH, e)
+                return None
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the on-disk classification result store")
+    parser.add_argument("--path", default=RESULT_STORE_PATH, help="SQLite file (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Print the number of stored results")
+    compact = sub.add_parser("compact", help="Evict entries and reclaim disk space")
+    compact.add_argument("--max-entries", type=int, help="Keep at most this many most recently used rows")
+    compact.add_argument("--max-age-days", type=float, help="Drop rows not used for this many days")
+    compact.add_argument("--keep-prompt-version", action="append", dest="keep_prompt_versions",
+                         help="Drop rows for every other prompt version (repeatable)")
+    args = parser.parse_args()
+
+    store = ResultStore(args.path)
+    if args.command == "compact":
+        removed = store.compact(args.max_entries, args.max_age_days, args.keep_prompt_versions)
+        print(f"Removed {removed} rows, {len(store)} left")
+    else:
+        print(f"{len(store)} results in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Recycling rules for every state/UT and major cities, loaded from data/recycling_rules.json.
+
+Lookups go city -> state -> national, so a city without its own entry gets its
+state's rules and a state without rules gets the national ones. Names are
+normalized before lookup ("NCT of Delhi", "Bangalore", "Tamilnadu" and "Orissa"
+all resolve), with a close-match fallback for spelling variants.
+
+The file is re-read when its modification time changes (checked at most every
+RULES_RELOAD_SECONDS), so rules can be edited without restarting workers.
+"""
+import difflib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.getenv("RECYCLING_RULES_PATH",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "recycling_rules.json"))
+RULES_RELOAD_SECONDS = float(os.getenv("RULES_RELOAD_SECONDS", "5"))
+
+# Words geocoders put around names that do not help identify the place
+_NOISE = re.compile(r"\b(national capital territory of|nct of|union territory of|state of|ut of|"
+                    r"municipal corporation|corporation|district|city|urban)\b")
+_CLOSE_MATCH_CUTOFF = 0.85
+_MAX_MEMOIZED = 4096
+
+
+def normalize(name: str) -> str:
+    """Lookup key: lower case, no accents, noise words or punctuation, no spaces"""
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    name = _NOISE.sub(" ", name.replace("&", " and "))
+    return re.sub(r"[^a-z]", "", name)
+
+
+@dataclass(frozen=True)
+class RulesMatch:
+    rules: Tuple[str, ...]
+    level: str  # "city", "state" or "national"
+    state: Optional[str]  # canonical names, None when not recognized
+    city: Optional[str]
+
+
+class RulesIndex:
+    """Lookup structures built once from the parsed rules file; a reload builds a new index"""
+
+    def __init__(self, data: dict):
+        self.national = tuple(data.get("national", []))
+        self.states: Tuple[str, ...] = tuple(sorted(data.get("states", {})))
+        self.state_position = {state: i for i, state in enumerate(self.states)}
+        self._state_keys: Dict[str, str] = {}
+        self._state_rules: Dict[str, Tuple[str, ...]] = {}
+        self._city_keys: Dict[str, Dict[str, str]] = {}
+        self._city_rules: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        # Memoized answers; geocoded names repeat a lot
+        self._lookups: Dict[Tuple[str, Optional[str]], RulesMatch] = {}
+        for state, entry in data.get("states", {}).items():
+            for alias in [state] + entry.get("aliases", []):
+                self._state_keys[normalize(alias)] = state
+            self._state_rules[state] = tuple(entry.get("rules", [])) or self.national
+            keys = self._city_keys[state] = {}
+            for city, city_entry in entry.get("cities", {}).items():
+                for alias in [city] + city_entry.get("aliases", []):
+                    keys[normalize(alias)] = city
+                self._city_rules[(state, city)] = tuple(city_entry.get("rules", [])) or self._state_rules[state]
+
+    @staticmethod
+    def _resolve(key: str, table: Dict[str, str]) -> Optional[str]:
+        if not key:
+            return None
+        if key in table:
+            return table[key]
+        close = difflib.get_close_matches(key, table.keys(), n=1, cutoff=_CLOSE_MATCH_CUTOFF)
+        return table[close[0]] if close else None
+
+    def canonical_state(self, name: str) -> Optional[str]:
+        return self._resolve(normalize(name), self._state_keys)
+
+    def canonical_city(self, state: str, name: str) -> Optional[str]:
+        return self._resolve(normalize(name), self._city_keys.get(state, {}))
+
+    def lookup(self, state: str, city: Optional[str] = None) -> RulesMatch:
+        match = self._lookups.get((state, city))
+        if match is None:
+            match = self._lookup(state, city)
+            if len(self._lookups) < _MAX_MEMOIZED:
+                self._lookups[(state, city)] = match
+        return match
+
+    def _lookup(self, state: str, city: Optional[str]) -> RulesMatch:
+        canonical = self.canonical_state(state)
+        if canonical is None:
+            return RulesMatch(self.national, "national", None, None)
+        canonical_city = self.canonical_city(canonical, city) if city else None
+        if canonical_city is not None:
+            return RulesMatch(self._city_rules[(canonical, canonical_city)], "city", canonical, canonical_city)
+        return RulesMatch(self._state_rules[canonical], "state", canonical, None)
+
+
+class RulesStore:
+    """Hot-reloading holder of the current RulesIndex"""
+
+    def __init__(self, path: str = RULES_PATH, reload_seconds: float = RULES_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._index: Optional[RulesIndex] = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        mtime = os.stat(self.path).st_mtime_ns
+        if self._index is not None and mtime == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as fh:
+            index = RulesIndex(json.load(fh))
+        self._index, self._mtime = index, mtime
+        logger.info("Loaded recycling rules for %d states/UTs from %s", len(index.states), self.path)
+
+    def index(self) -> RulesIndex:
+        now = time.monotonic()
+        if self._index is None or now - self._checked >= self.reload_seconds:
+            with self._lock:
+                if self._index is None or now - self._checked >= self.reload_seconds:
+                    self._checked = now
+                    try:
+                        self._load()
+                    except (OSError, ValueError) as e:
+                        if self._index is None:
+                            raise
+                        # Keep serving the last good rules while the file is being edited
+                        logger.warning("Could not reload recycling rules from %s: %s", self.path, e)
+        return self._index
+
+    def lookup(self, state: str, city: Optional[str] = None) -> RulesMatch:
+        return self.index().lookup(state, city)
+
+    def states(self) -> Tuple[str, ...]:
+        """Canonical state/UT names in alphabetical order, e.g. for a select box"""
+        return self.index().states
+
+    def state_position(self, state: str) -> int:
+        """Position of state in states(), or 0 if it is not known"""
+        index = self.index()
+        return index.state_position.get(index.canonical_state(state) or "", 0)
+
+    def canonical_state(self, name: str) -> Optional[str]:
+        return self.index().canonical_state(name)
+
+
+rules_store = RulesStore()
+
+
+def rules_for(state: str, city: Optional[str] = None) -> List[str]:
+    return list(rules_store.lookup(state, city).rules)
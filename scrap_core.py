@@ -0,0 +1,344 @@
+"""Classification engine shared by the Streamlit front ends, the CLI and the benchmarks.
+
+Nothing here imports Streamlit: the pipeline (caches, result store, near-duplicate
+grouping, pre-classifier, batching, rate-limited model calls) runs the same in a
+browser session, a batch job or a worker process. app.py and waste_info.py only
+differ in their prompt and in how they find the user's location.
+
+    engine = get_engine("app")
+    results = engine.classify(images, {"state": "Karnataka"})
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from batching import BATCH_SIZE, batch_contents, chunked
+from classification_cache import cache_key, classification_cache
+from concurrency import DEFAULT_MAX_IN_FLIGHT, iter_bounded
+from dedup import group_near_duplicates, hash_images, near_duplicate_index
+from preclassifier import get_preclassifier
+from preprocess import ImageInput, content_digest, model_part, preview
+from prompts import PromptTemplate, get_prompt, token_ledger
+from rate_limit import estimate_tokens, model_flight, model_limiter, retry_call
+from resources import model_client
+from result_store import get_result_store
+from rules_store import rules_for, rules_store
+from scrap_record import ScrapRecord, parse_batch, parse_record
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of model calls in flight for one upload batch
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT))
+
+DEFAULT_LOCATION = {"city": "Mumbai", "state": "Maharashtra", "country": "India"}
+
+def location_from_coordinates(lat: float, lon: float) -> Optional[Dict[str, str]]:
+    """Location for browser coordinates, or None if unknown; "city" is "" when only the state is known"""
+    from geocoding import reverse_geocode
+
+    resolved = reverse_geocode(lat, lon)
+    if resolved is None:
+        return None
+    return {
+        # The default city belongs to the default state, so it is never borrowed here
+        "city": resolved["city"] or "",
+        "state": rules_store.canonical_state(resolved["state"]) or resolved["state"],
+        "country": resolved["country"] or DEFAULT_LOCATION["country"],
+    }
+
+
+def location_from_ip() -> Optional[Dict[str, str]]:
+    """Approximate location from the server's public IP, with defaults for missing parts"""
+    from geocoding import ip_location
+
+    located = ip_location()
+    if located is None:
+        return None
+    location = {key: located.get(key) or default for key, default in DEFAULT_LOCATION.items()}
+    if located.get("state") and not located.get("city"):
+        location["city"] = ""
+    location["state"] = rules_store.canonical_state(location["state"]) or location["state"]
+    return location
+
+
+class ClassificationEngine:
+    """The classification pipeline for one prompt"""
+
+    def __init__(self, prompt: PromptTemplate, model=None):
+        self.prompt = prompt
+        # None: the process-wide backend from MODEL_BACKEND, built on first use
+        self._model = model
+
+    @property
+    def prompt_version(self) -> str:
+        return self.prompt.version
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = model_client()
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+
+    def build_prompt(self, state: str) -> str:
+        return self.prompt.render(state)
+
+    def classify_stream(self, images: List[ImageInput], location: Dict[str, str],
+                        max_in_flight: int = MAX_IN_FLIGHT,
+                        batch_size: int = BATCH_SIZE) -> Iterator[Tuple[str, int, Any]]:
+        """Streaming classification: yields events as answers arrive.
+
+        ("partial", index, text) is yielded while an image's answer is streaming in,
+        with the raw JSON text received so far, and ("done", index, result) once the
+        image is finished; result["record"] is its ScrapRecord. Events come in
+        completion order, not upload order.
+
+        Images are classified concurrently (at most max_in_flight model calls at once).
+        With batch_size > 1, up to that many images share one request; any image whose
+        record is missing from the batched answer is retried on its own. An image whose
+        call fails gets an "error" entry instead of aborting the whole batch.
+        PreparedImage inputs are sent to the model as their compact encoded bytes.
+
+        Near-identical photos (by perceptual hash) are classified once and the answer
+        is fanned out to the whole group; such entries carry "duplicate_of", the index
+        of the image that was actually sent.
+
+        With PRECLASSIFIER=on, images that closely resemble several earlier model
+        answers for the same item in this state are answered locally
+        ("matched_locally" is True).
+        """
+        state = location.get("state") or DEFAULT_LOCATION["state"]
+        # "NCT of Delhi" and "Delhi" must share cache entries
+        state = rules_store.canonical_state(state) or state
+        rules = rules_for(state, location.get("city"))
+        version = self.prompt_version
+        # Formatted once per state and reused for every image and batch
+        prompt = self.prompt.render(state)
+        keys = [cache_key(content_digest(image), state, version) for image in images]
+        # Thumbnails only: full pixels are never decoded here, and results do not hold on to images
+        previews = [preview(image) for image in images]
+        hashes = hash_images(previews)
+        groups = group_near_duplicates(hashes)
+        representatives = [group[0] for group in groups]
+        members = {group[0]: group for group in groups}
+
+        # Answers already known: memory cache first, then one bulk lookup on disk
+        known = {}
+        for index in representatives:
+            cached = classification_cache.get(keys[index])
+            if cached is not None:
+                known[keys[index]] = cached
+                metrics.inc("ecogenie_images_total", source="cache")
+        store = get_result_store()
+        if store is not None:
+            missing = [keys[index] for index in representatives if keys[index] not in known]
+            loaded = store.get_many(missing)
+            for index in representatives:
+                record = loaded.get(keys[index])
+                if record is not None:
+                    known[keys[index]] = ScrapRecord.from_dict(record["record"])
+                    classification_cache.put(keys[index], known[keys[index]])
+                    metrics.inc("ecogenie_images_total", source="store")
+                    near_duplicate_index.add(hashes[index], keys[index])
+
+        # Near misses: a slightly different photo of the same item was classified before
+        for index in representatives:
+            if keys[index] in known:
+                continue
+            for near_key in near_duplicate_index.nearest(hashes[index], state, version):
+                near_record = classification_cache.get(near_key)
+                if near_record is None and store is not None:
+                    stored = store.get(near_key)
+                    near_record = ScrapRecord.from_dict(stored["record"]) if stored else None
+                if near_record is not None:
+                    known[keys[index]] = near_record
+                    metrics.inc("ecogenie_images_total", source="near_duplicate")
+                    break
+
+        # Common items the local stage recognizes with confidence need no model call either
+        preclassifier = get_preclassifier()
+        matched_locally = set()
+        if preclassifier is not None:
+            for index in representatives:
+                if keys[index] in known:
+                    continue
+                match = preclassifier.classify(previews[index], state, version)
+                if match is not None:
+                    known[keys[index]] = match.record
+                    matched_locally.add(index)
+                    metrics.inc("ecogenie_images_total", source="preclassifier")
+        # Answers to write to the store; workers can still add to it after an early stop
+        fresh = {}
+        fresh_lock = threading.Lock()
+        flushed = threading.Event()
+
+        def remember(index: int, record: ScrapRecord):
+            key = keys[index]
+            classification_cache.put(key, record)
+            entry = {"record": record.to_dict(), "recycling_rules": rules}
+            with fresh_lock:
+                late = flushed.is_set()
+                if not late:
+                    fresh[key] = entry
+            if late and store is not None:
+                # Finished after the consumer stopped and the batch was written
+                store.put(key, entry)
+            near_duplicate_index.add(hashes[index], key)
+            if preclassifier is not None:
+                preclassifier.add(previews[index], record, state, version)
+            metrics.inc("ecogenie_images_total", source="model")
+
+        def stream_once(contents: List[Any], on_text, count: int) -> str:
+            generation_config = self.prompt.generation_config(count)
+            estimated = estimate_tokens(contents, self.prompt.answer_tokens)
+            model_limiter.acquire(estimated)
+            outcome = "error"
+            try:
+                with metrics.span("model_call"):
+                    response = self.model.generate_content(contents, stream=True, generation_config=generation_config)
+                    text = ""
+                    usage = None
+                    for chunk in response:
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        try:
+                            text += chunk.text
+                        except ValueError:
+                            # A chunk with no text part, e.g. one that only carries the finish reason
+                            continue
+                        on_text(text)
+                model_limiter.settle(estimated, getattr(usage, "total_token_count", None))
+                token_ledger.record(version, usage)
+                outcome = "ok"
+            finally:
+                metrics.inc("ecogenie_model_requests_total", kind="batch" if count > 1 else "single", outcome=outcome)
+            cap = generation_config.get("max_output_tokens")
+            if cap and (getattr(usage, "candidates_token_count", 0) or 0) >= cap:
+                try:
+                    json.loads(text)
+                except ValueError:
+                    raise ValueError(f"The answer was cut off at the {cap}-token output cap "
+                                     "(MODEL_MAX_OUTPUT_TOKENS, COMPACT_MAX_OUTPUT_TOKENS)") from None
+            return text
+
+        def stream_text(contents: List[Any], on_text, count: int) -> str:
+            """One model request within the shared quota; 429s and 5xx are retried with backoff"""
+            return retry_call(lambda: stream_once(contents, on_text, count),
+                              on_retry=lambda e, attempt: metrics.inc("ecogenie_retries_total", reason="transient"))
+
+        def classify_one(index: int, emit) -> ScrapRecord:
+            def call() -> ScrapRecord:
+                # Another session may have finished the same image while this one was queued
+                cached = classification_cache.get(keys[index])
+                if cached is not None:
+                    return cached
+                text = stream_text([prompt, model_part(images[index])], lambda t: emit({index: t}), 1)
+                if not text:
+                    raise ValueError("The model returned no text for this image")
+                record = parse_record(text)
+                # Only the call that reached the model records it, so each answer is indexed and stored once
+                remember(index, record)
+                return record
+
+            # Sessions uploading the same image at the same time share one model call
+            return model_flight.do(keys[index], call)
+
+        def classify_unit(unit: List[int], emit) -> Dict[int, Any]:
+            """One model request for the images in unit: index -> ScrapRecord, or the exception for that image"""
+            if len(unit) == 1:
+                return {unit[0]: classify_one(unit[0], emit)}
+
+            sections = {}
+            contents = batch_contents(prompt, [model_part(images[index]) for index in unit])
+            try:
+                # A JSON array cannot be split per image until it is complete, so no partials here
+                text = stream_text(contents, lambda t: None, len(unit))
+                sections = parse_batch(text, len(unit))
+            except ValueError as e:
+                # A malformed or cut-off answer: the images are fine to ask about one at a time
+                logger.warning("Batched answer for %d images was unusable, retrying one by one: %s", len(unit), e)
+            except Exception as e:
+                # Quota exhausted, retries used up or a hard error: sending each image again would only add load
+                return {index: e for index in unit}
+
+            answers = {}
+            for position, index in enumerate(unit):
+                if position in sections:
+                    remember(index, sections[position])
+                    answers[index] = sections[position]
+                    continue
+                metrics.inc("ecogenie_retries_total", reason="batch_fallback")
+                try:
+                    answers[index] = classify_one(index, emit)
+                except Exception as e:
+                    answers[index] = e
+            return answers
+
+        def finished(representative: int, record, error):
+            for index in members[representative]:
+                yield ("done", index, {
+                    "record": record,
+                    "error": error,
+                    "duplicate_of": representative if index != representative else None,
+                    "matched_locally": representative in matched_locally,
+                    "recycling_rules": rules
+                })
+
+        try:
+            # Answers we already have need no model call
+            for index in representatives:
+                if keys[index] in known:
+                    yield from finished(index, known[keys[index]], None)
+
+            units = list(chunked([index for index in representatives if keys[index] not in known], batch_size))
+            for position, partial, outcome in iter_bounded(classify_unit, units, max_in_flight):
+                if outcome is None:
+                    for representative, text in partial.items():
+                        for index in members[representative]:
+                            yield ("partial", index, text)
+                elif outcome.ok:
+                    for representative, answer in outcome.value.items():
+                        if isinstance(answer, Exception):
+                            yield from finished(representative, None, str(answer) or answer.__class__.__name__)
+                        else:
+                            yield from finished(representative, answer, None)
+                else:
+                    for representative in units[position]:
+                        yield from finished(representative, None, outcome.error)
+        finally:
+            # Also runs when the consumer stops early, so finished answers are never lost
+            with fresh_lock:
+                flushed.set()
+                pending = dict(fresh)
+            if store is not None:
+                store.put_many(pending)
+
+    def classify(self, images: List[ImageInput], location: Dict[str, str], max_in_flight: int = MAX_IN_FLIGHT,
+                 batch_size: int = BATCH_SIZE) -> List[Dict[str, Any]]:
+        """One result per image in upload order; see classify_stream"""
+        classifications = [None] * len(images)
+        for kind, index, payload in self.classify_stream(images, location, max_in_flight, batch_size):
+            if kind == "done":
+                classifications[index] = payload
+        return classifications
+
+
+_engines: Dict[str, ClassificationEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name: str = "app", variant: Optional[str] = None) -> ClassificationEngine:
+    """Process-wide engine for the named front end ("app" or "waste_info") and prompt variant"""
+    prompt = get_prompt(name, variant)
+    engine = _engines.get(prompt.version)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(prompt.version)
+            if engine is None:
+                engine = _engines[prompt.version] = ClassificationEngine(prompt)
+    return engine
@@ -0,0 +1,158 @@
+"""Structured classification output.
+
+The model is asked for JSON matching RESPONSE_SCHEMA and each answer is parsed
+into a ScrapRecord, so rendering, caching and export work on fields instead of
+splitting free text.
+"""
+import json
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "item": {"type": "string", "description": "Short name of the object, e.g. 'PET water bottle'"},
+        "material": {"type": "string", "description": "Main material category, e.g. plastic, paper, metal, e-waste, glass"},
+        "recyclable": {"type": "boolean"},
+        "recyclability_notes": {"type": "string"},
+        "value_min_inr": {"type": "number", "nullable": True, "description": "Lowest expected scrap value in rupees"},
+        "value_max_inr": {"type": "number", "nullable": True, "description": "Highest expected scrap value in rupees"},
+        "preparation_steps": {"type": "array", "items": {"type": "string"}},
+        "safety": {"type": "array", "items": {"type": "string"}},
+        "hazardous": {"type": "boolean", "description": "True for batteries, chemicals, sharp or toxic items"},
+        "environmental_impact": {"type": "string"},
+    },
+    "required": ["item", "material", "recyclable", "recyclability_notes", "value_min_inr", "value_max_inr",
+                 "preparation_steps", "safety", "hazardous", "environmental_impact"],
+}
+
+BATCH_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"image_number": {"type": "integer"}, **RESPONSE_SCHEMA["properties"]},
+        "required": ["image_number", *RESPONSE_SCHEMA["required"]],
+    },
+}
+
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+BATCH_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": BATCH_RESPONSE_SCHEMA}
+
+
+@dataclass
+class ScrapRecord:
+    """Classification of one item"""
+    __slots__ = ("item", "material", "recyclable", "recyclability_notes", "value_min_inr", "value_max_inr",
+                 "preparation_steps", "safety", "hazardous", "environmental_impact")
+
+    item: str
+    material: str
+    recyclable: bool
+    recyclability_notes: str
+    value_min_inr: Optional[float]
+    value_max_inr: Optional[float]
+    preparation_steps: List[str]
+    safety: List[str]
+    hazardous: bool
+    environmental_impact: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScrapRecord":
+        """Build a record from decoded JSON, coercing loosely typed model output"""
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object for the classification")
+        low, high = _number(data.get("value_min_inr")), _number(data.get("value_max_inr"))
+        if low is not None and high is not None and low > high:
+            low, high = high, low
+        return cls(
+            item=str(data.get("item") or "Unknown item").strip(),
+            material=str(data.get("material") or "unknown").strip().lower(),
+            recyclable=bool(data.get("recyclable", False)),
+            recyclability_notes=str(data.get("recyclability_notes") or "").strip(),
+            value_min_inr=low,
+            value_max_inr=high,
+            preparation_steps=_strings(data.get("preparation_steps")),
+            safety=_strings(data.get("safety")),
+            hazardous=bool(data.get("hazardous", False)),
+            environmental_impact=str(data.get("environmental_impact") or "").strip(),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @property
+    def value_range(self) -> str:
+        if self.value_min_inr is None and self.value_max_inr is None:
+            return "No resale value"
+        low = self.value_min_inr if self.value_min_inr is not None else self.value_max_inr
+        high = self.value_max_inr if self.value_max_inr is not None else self.value_min_inr
+        return f"₹{low:,.0f}" if low == high else f"₹{low:,.0f} – ₹{high:,.0f}"
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _strings(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def parse_record(text: str) -> ScrapRecord:
+    """Parse one JSON answer; raises ValueError when it is not a usable record"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The model did not return valid JSON: {e}") from None
+    return ScrapRecord.from_dict(data)
+
+
+def parse_batch(text: str, count: int) -> Dict[int, ScrapRecord]:
+    """Map 0-based image position -> record for a batched JSON array answer.
+
+    Entries that are malformed, duplicated or out of range are left out, so callers
+    can fall back to single-image requests for exactly those positions.
+    """
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, list):
+        return {}
+    records: Dict[int, ScrapRecord] = {}
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            position = int(entry.get("image_number")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= position < count and position not in records:
+            try:
+                records[position] = ScrapRecord.from_dict(entry)
+            except ValueError:
+                continue
+    return records
+
+
+_COMPLETE_STRING_FIELD = re.compile(r'"(item|material|recyclability_notes)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def partial_preview(text: str) -> Dict[str, str]:
+    """Fields that are already complete in a JSON answer that is still streaming in"""
+    preview = {}
+    for name, raw in _COMPLETE_STRING_FIELD.findall(text):
+        try:
+            preview[name] = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            continue
+    return preview
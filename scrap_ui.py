@@ -0,0 +1,241 @@
+"""Streamlit rendering shared by app.py and waste_info.py"""
+import html
+import os
+from typing import Any, Callable, Dict
+
+import streamlit as st
+
+import metrics
+from concurrency import run_bounded
+from memory_budget import memory_budget
+from preprocess import format_bytes, preprocess_cached
+from report import BatchSummary, export_bytes, xlsx_available
+from rules_store import rules_store
+from scrap_core import MAX_IN_FLIGHT, ClassificationEngine
+from scrap_record import ScrapRecord, partial_preview
+
+
+# With API_PORT set, this process also serves the HTTP API (api.py), sharing engines and caches with the UI
+if int(os.getenv("API_PORT", "0")):
+    from api import serve_in_background
+
+    serve_in_background()
+
+
+def result_html(record: ScrapRecord) -> str:
+    """The result-box markup for a finished record"""
+    verdict = "♻️ Recyclable" if record.recyclable else "🚫 Not recyclable"
+    return f"""
+    <div class='result-box'>
+        <div class='category-header'>{html.escape(record.item)} · {html.escape(record.material)}</div>
+        <p><b>{verdict}</b>: {html.escape(record.recyclability_notes)}</p>
+        <p>Scrap value: <span class='value-estimate'>{html.escape(record.value_range)}</span></p>
+        <p>🌍 {html.escape(record.environmental_impact)}</p>
+    </div>
+    """
+
+
+def render_result(result: Dict[str, Any]):
+    """Render one finished classification into the current Streamlit container"""
+    if result['duplicate_of'] is not None:
+        st.caption(f"Looks like the same item as Item {result['duplicate_of'] + 1}, so its analysis is reused.")
+
+    if result['matched_locally']:
+        st.caption("Recognized from earlier analyses of similar items, without asking the AI model.")
+
+    if result['error']:
+        st.error(f"Could not analyze this item: {result['error']}")
+        return
+
+    record = result['record']
+    st.markdown(result_html(record), unsafe_allow_html=True)
+    
+    # Display preparation tips
+    if record.preparation_steps:
+        st.markdown("#### 🔧 Preparation Checklist")
+        st.info("\n".join(f"- {step}" for step in record.preparation_steps))
+    
+    # Display safety warnings if present
+    if record.safety:
+        st.markdown("#### ⚠️ Safety Guidelines")
+        st.warning("\n".join(f"- {tip}" for tip in record.safety))
+
+
+def render_partial(text: str) -> str:
+    """HTML for an answer that is still streaming in"""
+    preview = partial_preview(text)
+    heading = " · ".join(html.escape(preview[f]) for f in ("item", "material") if f in preview)
+    notes = html.escape(preview.get("recyclability_notes", ""))
+    return (f"<div class='result-box'><div class='category-header'>{heading or 'Analyzing...'}</div>"
+            f"<p>{notes} ▌</p></div>")
+
+
+def render_totals(summary: BatchSummary):
+    """Running totals for the batch, redrawn as each item finishes"""
+    st.markdown("### 📊 Batch Totals")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Items analyzed", f"{summary.classified} of {summary.items}",
+                help=f"{summary.duplicates} repeat photos of items above are not counted again"
+                if summary.duplicates else None)
+    col2.metric("Recyclable", summary.recyclable)
+    col3.metric("Estimated scrap value", summary.value_range)
+    if summary.by_material:
+        st.dataframe([{"Material": row["material"], "Items": row["items"], "Recyclable": row["recyclable"],
+                       "Value (₹)": f"{row['value_min_inr']:,.0f} – {row['value_max_inr']:,.0f}"}
+                      for row in summary.material_rows()], hide_index=True)
+    if summary.hazardous:
+        st.warning("⚠️ Hazardous items to hand over separately: "
+                   + ", ".join(item for _, item in summary.hazardous))
+
+
+def render_downloads(results):
+    """Download buttons for the finished batch; XLSX only when openpyxl is installed"""
+    formats = [("csv", "text/csv"), ("json", "application/json")]
+    if xlsx_available():
+        formats.append(("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"))
+    for column, (fmt, mime) in zip(st.columns(len(formats)), formats):
+        column.download_button(f"Download {fmt.upper()}", export_bytes(fmt, results),
+                               file_name=f"scrap-report.{fmt}", mime=mime, key=f"report-{fmt}")
+
+
+def render_uploads(engine: ClassificationEngine, location: Dict[str, str], uploaded_files, allowance):
+    """Prepare, lay out and classify the uploaded files within the session's memory allowance"""
+    with st.spinner("Preparing your images..."):
+        images, names, shed = [], [], []
+        for file, outcome in zip(uploaded_files, run_bounded(preprocess_cached, uploaded_files, MAX_IN_FLIGHT)):
+            if not outcome.ok:
+                st.warning(f"Skipping {file.name}: could not read image ({outcome.error})")
+                continue
+            kept = allowance.admit(outcome.value)
+            if kept is not None:
+                images.append(kept)
+                names.append(file.name)
+            else:
+                shed.append(file.name)
+        if shed:
+            st.warning(f"Too many images at once, so {len(shed)} were skipped: {', '.join(shed)}. "
+                       "Upload them again in a smaller batch.")
+
+    # Totals sit above the items and are updated as each one finishes
+    totals = st.empty()
+    summary, finished = BatchSummary(), [None] * len(images)
+
+    # Lay out every item up front, then fill each one in as its answer streams in
+    panels = []
+    for i, image in enumerate(images):
+        st.markdown(f"### Item {i+1}")
+        
+        # Create columns for image and analysis
+        col1, col2 = st.columns([1, 2])
+        
+        with col1:
+            # The small JPEG made during preprocessing, passed through as-is
+            st.image(image.thumbnail, use_column_width=True)
+            st.caption(f"Sent {format_bytes(image.encoded_bytes)} instead of "
+                       f"{format_bytes(image.original_bytes)} "
+                       f"({format_bytes(image.bytes_saved)} saved)")
+        
+        with col2:
+            panels.append(st.empty())
+            panels[-1].info("Waiting for analysis...")
+
+        st.markdown("---")
+
+    with st.spinner("Analyzing your items..."):
+        for kind, index, payload in engine.classify_stream(images, location):
+            if kind == "partial":
+                panels[index].markdown(render_partial(payload), unsafe_allow_html=True)
+            else:
+                with panels[index].container(), metrics.span("render"):
+                    render_result(payload)
+                summary.add(payload, names[index])
+                finished[index] = (names[index], payload)
+                with totals.container():
+                    render_totals(summary)
+
+    st.success("Analysis Complete!")
+    results = [item for item in finished if item is not None]
+    if results:
+        render_downloads(results)
+    st.balloons()
+
+
+def run_page(engine: ClassificationEngine, get_location: Callable[[], Dict[str, str]]):
+    """The upload-and-classify page; front ends differ only in engine (prompt) and location source"""
+    metrics.inc("ecogenie_page_runs_total", prompt=engine.prompt_version)
+    # Custom CSS with enhanced styling
+    st.markdown("""
+    <style>
+    .title {
+        text-align: center;
+        font-size: 3em;
+        color: #008080;
+        transition: color 1s ease;
+    }
+    .title:hover {
+        color: #B8860B;
+    }
+    .result-box {
+        padding: 20px;
+        margin: 15px 0;
+        border-radius: 10px;
+        border: 2px solid #e0e0e0;
+    }
+    .category-header {
+        color: #2c3e50;
+        font-size: 1.2em;
+        margin: 10px 0;
+    }
+    .value-estimate {
+        color: #27ae60;
+        font-weight: bold;
+    }
+    .safety-warning {
+        color: #e74c3c;
+        padding: 10px;
+        background-color: #ffebee;
+        border-radius: 5px;
+        margin: 10px 0;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+    st.markdown("<h1 class='title'>♻️ Smart Scrap Classifier</h1>", unsafe_allow_html=True)
+    
+    # Sidebar setup
+    st.sidebar.header("Upload and Classify Scrap")
+    
+    # Location handling
+    location = get_location()
+    st.sidebar.write("Active Location: " + ", ".join(part for part in (location.get('city'), location['state']) if part))
+    
+    # Display local recycling rules
+    with st.expander("View Local Recycling Rules"):
+        match = rules_store.lookup(location['state'], location.get('city'))
+        if match.level == "national":
+            st.caption("No rules specific to your area yet; these apply across India.")
+        for rule in match.rules:
+            st.write(f"• {rule}")
+    
+    # File upload
+    uploaded_files = st.file_uploader(
+        "Upload images of scrap items",
+        accept_multiple_files=True,
+        type=["jpg", "jpeg", "png", "webp"]
+    )
+
+    if uploaded_files:
+        # Charges for the images this run holds are returned when it finishes
+        with memory_budget.session() as allowance:
+            render_uploads(engine, location, uploaded_files, allowance)
+
+    else:
+        # Display welcome message and instructions
+        st.info("👋 Welcome! Upload images of your scrap items to get:")
+        st.markdown("""
+        - ♻️ Recyclability analysis
+        - 💰 Potential scrap value
+        - 📝 Preparation guidelines
+        - ⚠️ Safety recommendations
+        - 🌍 Environmental impact
+        """)